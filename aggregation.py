@@ -0,0 +1,50 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import pandas as pd
+
+from datastore import partition_years, read_dataset
+
+# Processes aggregating the Year partitions, every core by default
+AGGREGATION_PROCESSES = int(os.environ.get("AGGREGATION_PROCESSES", 0)) or os.cpu_count() or 1
+
+
+def _aggregate_partition(function, path, columns, years):
+    return function(read_dataset(path, columns, years))
+
+
+def map_partitions(function, path, columns=None, years=None, processes=AGGREGATION_PROCESSES):
+    """Aggregate every Year partition of the dataset on a process pool.
+
+    Each process reads its own partitions and applies the function to their rows, so only the
+    partial aggregates it returns travel between processes. They come back in the order the
+    dataset reads the partitions, to be merged by the merge_* helpers or by the caller.
+
+    The processes are spawned rather than forked: the app can build the rollups from a threaded
+    gunicorn worker, and forking a process with other threads running can deadlock the children.
+    """
+    aggregate = partial(_aggregate_partition, function, path, columns)
+    partitions = partition_years(path, years)
+    if processes <= 1 or len(partitions) <= 1:
+        return [aggregate(partition) for partition in partitions]
+    with ProcessPoolExecutor(min(processes, len(partitions)), mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(aggregate, partitions))
+
+
+# Helper function to add up partial sums or counts indexed by their keys, the keys in order of first appearance
+def merge_sums(partials):
+    merged = pd.concat(partials)
+    return merged.groupby(level=list(range(merged.index.nlevels)), sort=False).sum()
+
+
+# Helper function to unite partial sets of distinct values, in order of first appearance
+def merge_distinct(partials):
+    return pd.Index(pd.concat([pd.Series(values, dtype=object) for values in partials], ignore_index=True).unique())
+
+
+# Helper function to keep the largest partial value of every key, the same whatever the order of the partials
+def merge_max(partials):
+    merged = pd.concat(partials)
+    return merged.groupby(level=list(range(merged.index.nlevels)), sort=False).max()
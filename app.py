@@ -1,17 +1,90 @@
+import hashlib
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache, partial
+
 import dash
-from dash import dcc, html, Input, Output
+from dash import dcc, html, ClientsideFunction, DiskcacheManager, Input, Output, State
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
+from flask import Response
+
+import metrics
+import profiling
+from figure_cache import CACHE_DIR, FigureCache, file_fingerprint
+from figure_encoding import encode_figure
+from forksafe import ForkSafeCache
+from datastore import parse_years, read_mapped
+from rollups import read_rollups, rollup_dataset
+from sketches import box_statistics, build_sketches, merge_sketches, select_sketches
+from star_schema import build_star_schema, distinct_count, fare_mean, passenger_sum, route_distances
+from warmup import Warmup
+
+# Path of the preprocessed dataset, partitioned by Year, loaded on first use by the pages built from it
+DATASET_PATH = os.environ.get("DATASET_PATH", 'datasets/_dataset')  # Adjust path if needed
+if not os.path.exists(DATASET_PATH) and "DATASET_PATH" not in os.environ:
+    # Single-file dataset written by earlier versions of files/preprocessing_code.py
+    DATASET_PATH = 'datasets/_dataset.parquet'
+
+# Years served by the Graphs, Data Summary, Top 10 and Trend pages, e.g. "2015-2024", every year when unset
+DATASET_YEARS = parse_years(os.environ.get("DATASET_YEARS"))
+
+# Directory of the rollups written by files/preprocessing_code.py
+ROLLUPS_PATH = os.environ.get("ROLLUPS_PATH", 'datasets/_dataset_rollups')
+
+# The pages are served from the rollups, merging those of DATASET_YEARS when only some years are
+# served. When they are missing, the rollups are built from the dataset, one Year partition per process
+PAGES_SOURCE = ROLLUPS_PATH if os.path.exists(ROLLUPS_PATH) else DATASET_PATH
+
+
+# Load the star schema that feeds the Data Summary, Top 10 and Trend pages
+@lru_cache(maxsize=None)
+@profiling.profiled("star-schema")
+@metrics.stage("load")
+def load_star_schema():
+    if PAGES_SOURCE == ROLLUPS_PATH:
+        return build_star_schema(read_rollups(ROLLUPS_PATH, DATASET_YEARS))
+    return build_star_schema(rollup_dataset(DATASET_PATH, DATASET_YEARS))
+
+
+# Fingerprint of this file, the cached figures are dropped when it changes
+APP_FINGERPRINT = file_fingerprint(__file__)
+
+# Figures of the Data Summary, Top 10 and Trend pages are persisted until the data or this file changes
+page_cache = FigureCache(
+    "pages",
+    f"{file_fingerprint(PAGES_SOURCE)}-{APP_FINGERPRINT}-{DATASET_YEARS}",
+)
 
-# Load the preprocessed dataset
-df = pd.read_parquet('datasets/_dataset.parquet')  # Adjust path if needed
+# Heavy /graphs selections run in subprocesses of the workers, see update_graphs_in_background.
+# Their progress and results go through a disk cache shared by every worker process on the host
+background_callback_manager = DiskcacheManager(ForkSafeCache(os.path.join(CACHE_DIR, "background")))
 
 # Initialize the Dash app with Bootstrap styling
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.LUX])
+# Responses are gzip or brotli compressed for the clients accepting it
+app = dash.Dash(
+    __name__,
+    external_stylesheets=[dbc.themes.LUX],
+    compress=True,
+    background_callback_manager=background_callback_manager,
+)
 app.title = "Data Analysis Dashboard"
 
+# WSGI application served by gunicorn, see gunicorn.conf.py
+server = app.server
+
+# Timings, input sizes and payload sizes of the callbacks, summed over all workers and exported on /metrics
+metrics_store = metrics.MetricsStore(os.path.join(CACHE_DIR, "metrics.sqlite"))
+metrics.instrument(server, metrics_store)
+
+# Opt-in CPU and allocation profiles of callback requests and page builders, see profiling.py
+profiling.instrument(server)
+
 # Layout for the Homepage
 home_layout = html.Div([
     html.H1("Welcome to the US Airline Data Analysis Dashboard", className="text-center my-4", style={"color": "#1d3557"}),
@@ -86,31 +159,202 @@ home_layout = html.Div([
 
 import dash_daq as daq
 
-# Load the data
-df_graphs = pd.read_parquet("datasets/_dataset_graphs.parquet")
+# Load the serving-ready data, built by files/build_graphs_dataset.py with parsed
+# float32 coordinates, cleaned categorical city names and the precomputed route key.
+# It is read through a memory-mapped Arrow copy, so all workers share one read-only copy of its columns
+GRAPHS_DATASET_PATH = os.environ.get("GRAPHS_DATASET_PATH", "datasets/_dataset_graphs_serving.parquet")
+GRAPHS_FINGERPRINT = file_fingerprint(GRAPHS_DATASET_PATH)
+
+# Columns of the serving data used by the /graphs callbacks, the others are never loaded
+GRAPHS_COLUMNS = [
+    "Year", "city1", "city2", "airport_1", "airport_2", "route", "passengers", "fare", "fare_lg", "fare_low",
+    "start_lat", "start_lon", "end_lat", "end_lon",
+]
+
+# Only the columns and DATASET_YEARS of the serving data are copied into the mapped Arrow file
+GRAPHS_SELECTION = hashlib.sha256(f"{GRAPHS_FINGERPRINT}-{GRAPHS_COLUMNS}-{DATASET_YEARS}".encode()).hexdigest()
+df_graphs = read_mapped(
+    GRAPHS_DATASET_PATH,
+    os.path.join(CACHE_DIR, f"graphs-{GRAPHS_SELECTION[:16]}.arrow"),
+    columns=GRAPHS_COLUMNS,
+    years=DATASET_YEARS,
+)
+
+# Figures of the /graphs callbacks are cached across workers until the data, the served years or this file changes
+graphs_cache = FigureCache("graphs", f"{GRAPHS_SELECTION}-{APP_FINGERPRINT}")
+
+# Columns of df_graphs that are filtered by the /graphs dropdowns
+FILTER_COLUMNS = ["Year", "city1", "city2"]
+
+
+# Helper function to index the row positions of every value of the filter columns
+def create_filter_index(df, columns):
+    index = {}
+    for column in columns:
+        codes, values = pd.factorize(df[column], sort=True)
+        # Row positions grouped by value, each group kept in row order
+        order = np.argsort(codes, kind="stable")
+        bounds = np.cumsum(np.bincount(codes, minlength=len(values)))[:-1]
+        index[column] = dict(zip(values.tolist(), np.split(order, bounds)))
+    return index
+
+
+filter_index = create_filter_index(df_graphs, FILTER_COLUMNS)
+
+# Fare sketches of every route and year, merged over the selected years for the box plot
+fare_sketches = build_sketches(df_graphs, ["route", "Year"], "fare")
+
+
+# Helper function to resolve a selection to sorted row positions, None means no filter
+def filter_positions(selections, index=filter_index):
+    matches = []
+    for column, selected in selections.items():
+        # An empty selection does not filter the column at all
+        if not selected:
+            continue
+        groups = [index[column][value] for value in selected if value in index[column]]
+        if len(groups) == 1:
+            matches.append(groups[0])
+        elif groups:
+            matches.append(np.unique(np.concatenate(groups)))
+        else:
+            matches.append(np.empty(0, dtype=np.intp))
+
+    if not matches:
+        return None
+
+    # Intersect starting from the smallest set of positions
+    matches.sort(key=len)
+    positions = matches[0]
+    for other in matches[1:]:
+        positions = np.intersect1d(positions, other, assume_unique=True)
+    return positions
+
+
+# Filtered rows from which an uncached /graphs selection is computed in the background
+BACKGROUND_MIN_ROWS = int(os.environ.get("BACKGROUND_MIN_ROWS", 200_000))
+
+
+# Helper function to count the rows of df_graphs left by the filters, without filtering them
+def count_filtered_rows(year_selected, source_city_selected, destination_city_selected):
+    positions = filter_positions(
+        {
+            "Year": normalize_selection(year_selected),
+            "city1": normalize_selection(source_city_selected),
+            "city2": normalize_selection(destination_city_selected),
+        }
+    )
+    return len(df_graphs) if positions is None else len(positions)
+
+
+# Number of routes offered by the route dropdown for a search
+ROUTE_SEARCH_LIMIT = 50
+
+# Prefix index of the route names: the words of every route, sorted, with the rank of their route
+RouteSearchIndex = namedtuple("RouteSearchIndex", ["routes", "tokens", "ranks"])
+
+
+# Helper function to index the words of the route names, routes are ranked by passenger volume
+def create_route_search_index(df):
+    passengers = df.groupby("route", observed=True)["passengers"].sum()
+    routes = passengers.sort_values(ascending=False, kind="stable").index.astype(str).to_numpy()
+
+    tokens, ranks = [], []
+    for rank, route in enumerate(routes):
+        words = set(re.findall(r"\w+", route.lower()))
+        tokens.extend(words)
+        ranks.extend([rank] * len(words))
+    order = np.argsort(tokens, kind="stable")
+    return RouteSearchIndex(routes, np.array(tokens)[order], np.array(ranks)[order])
+
+
+route_search_index = create_route_search_index(df_graphs)
+
+
+# Helper function to find the busiest routes having a word starting with every word of the search
+def search_routes(search, index=route_search_index, limit=ROUTE_SEARCH_LIMIT):
+    matches = None
+    for word in re.findall(r"\w+", (search or "").lower()):
+        # The words starting with this one form a range of the sorted tokens
+        start, stop = np.searchsorted(index.tokens, [word, word + "\uffff"])
+        ranks = np.unique(index.ranks[start:stop])
+        matches = ranks if matches is None else np.intersect1d(matches, ranks, assume_unique=True)
+    if matches is None:
+        return index.routes[:limit].tolist()
+    return index.routes[matches[:limit]].tolist()
+
+
+# Maximum number of route lines drawn on the map, the lowest-traffic routes are thinned beyond it
+MAX_ROUTE_LINES = int(os.environ.get("MAX_ROUTE_LINES", 1500))
+
+
+# Helper function to draw the route lines as one Scattergeo trace per color
+def create_route_line_traces(df_routes, city_colors, max_routes=MAX_ROUTE_LINES):
+    # Collapse repeated rows (years, quarters) into one line per route
+    routes = df_routes.groupby(["city1", "city2"], sort=False, observed=True).agg(
+        start_lat=("start_lat", "first"),
+        start_lon=("start_lon", "first"),
+        end_lat=("end_lat", "first"),
+        end_lon=("end_lon", "first"),
+        passengers=("passengers", "sum"),
+    ).reset_index()
+
+    # Keep only the busiest routes once the selection gets too large
+    if max_routes and len(routes) > max_routes:
+        busiest = np.argpartition(routes["passengers"].to_numpy(), -max_routes)[-max_routes:]
+        routes = routes.iloc[busiest]
+
+    colors = routes["city1"].map(city_colors).to_numpy()
 
-# Split 'Geocoded_City1' into 'start_lat' and 'start_lon'
-df_graphs[["start_lat", "start_lon"]] = df_graphs["Geocoded_City1"].str.split(", ", expand=True)
+    traces = []
+    for color in pd.unique(colors):
+        group = routes[colors == color]
 
-# Split 'Geocoded_City2' into 'end_lat' and 'end_lon'
-df_graphs[["end_lat", "end_lon"]] = df_graphs["Geocoded_City2"].str.split(", ", expand=True)
+        # Each route becomes [start, end, NaN] so that all lines fit in one trace
+        lon = np.full((len(group), 3), np.nan, dtype=np.float32)
+        lat = np.full((len(group), 3), np.nan, dtype=np.float32)
+        lon[:, 0], lon[:, 1] = group["start_lon"], group["end_lon"]
+        lat[:, 0], lat[:, 1] = group["start_lat"], group["end_lat"]
 
-# Convert the latitude and longitude columns to numeric
-df_graphs["start_lat"] = pd.to_numeric(df_graphs["start_lat"])
-df_graphs["start_lon"] = pd.to_numeric(df_graphs["start_lon"])
-df_graphs["end_lat"] = pd.to_numeric(df_graphs["end_lat"])
-df_graphs["end_lon"] = pd.to_numeric(df_graphs["end_lon"])
+        traces.append(
+            go.Scattergeo(
+                locationmode="USA-states",
+                lon=lon.ravel(),
+                lat=lat.ravel(),
+                mode="lines",
+                line=dict(width=1, color=color),
+                opacity=0.5,
+            )
+        )
+
+    return traces
+
+
+# Maximum number of city-to-city flows drawn on the Sankey diagram, the smaller flows are collapsed beyond it
+MAX_SANKEY_LINKS = int(os.environ.get("MAX_SANKEY_LINKS", 100))
 
+# Label of the node the flows beyond MAX_SANKEY_LINKS are collapsed into
+SANKEY_OTHER = "Other"
 
-# Remove "Metropolitan Area" from city names
-def remove_metropolitan(route):
-    return route.replace("(Metropolitan Area)", "").strip()
 
-df_graphs["city1"] = df_graphs["city1"].apply(remove_metropolitan)
-df_graphs["city2"] = df_graphs["city2"].apply(remove_metropolitan)
+# Helper function to aggregate the rows into one Sankey link per city pair, summing or averaging a column.
+# Beyond max_links, the smaller flows of each source city are merged into one link to the "Other" node
+def create_sankey_links(df_routes, column, how="sum", max_links=MAX_SANKEY_LINKS):
+    pairs = df_routes.groupby(["city1", "city2"], sort=False, observed=True)[column].agg(["sum", "count"])
+    pairs = pairs.reset_index()
+    pairs["city1"] = pairs["city1"].astype(str)
+    pairs["city2"] = pairs["city2"].astype(str)
 
-# Create a new column for the route to make selection easier
-df_graphs["route"] = df_graphs["city1"] + " - " + df_graphs["city2"]
+    value = pairs["sum"] if how == "sum" else pairs["sum"] / pairs["count"]
+    if max_links and len(pairs) > max_links:
+        largest = np.zeros(len(pairs), dtype=bool)
+        largest[np.argpartition(value.to_numpy(), -max_links)[-max_links:]] = True
+        rest = pairs[~largest].groupby("city1", sort=False)[["sum", "count"]].sum().reset_index()
+        rest["city2"] = SANKEY_OTHER
+        pairs = pd.concat([pairs[largest], rest], ignore_index=True)
+
+    pairs["value"] = pairs["sum"] if how == "sum" else pairs["sum"] / pairs["count"]
+    return pairs[["city1", "city2", "value"]]
 
 # Define the layout of the app
 graphs_layout = html.Div(
@@ -184,6 +428,14 @@ graphs_layout = html.Div(
                 "bgcolor": "rgba(150, 150, 150, 0.5)",
             },
         ),
+        # Progress of the selections computed in the background, shown while they run
+        html.Div(
+            dbc.Progress(id="graphs-progress", value=0, striped=True, animated=True, style={"height": "24px"}),
+            id="graphs-progress-container",
+            style={"display": "none", "margin-top": "10px"},
+        ),
+        # Selection left to the background callback, see route_graphs_selection
+        dcc.Store(id="graphs-background-selection"),
         html.Br(),
         # Div for Route Map and Box Plot
         html.Div(
@@ -219,6 +471,8 @@ graphs_layout = html.Div(
                             },
                         ),
                         html.Br(),
+                        # Both directions of the map, shown by the switch in the browser
+                        dcc.Store(id="route-map-store"),
                         dcc.Graph(
                             id="route-map", style={"height": "70vh", "width": "100%"}
                         ),
@@ -237,10 +491,8 @@ graphs_layout = html.Div(
                         html.Div(
                             dcc.Dropdown(
                                 id="route-dropdown",
-                                options=[
-                                    {"label": route, "value": route}
-                                    for route in df_graphs["route"].unique()
-                                ],
+                                # Loaded on demand from the route search index, see update_route_options
+                                options=[],
                                 placeholder="Select routes for box plot",
                                 multi=True,
                             ),
@@ -293,53 +545,80 @@ graphs_layout = html.Div(
                     },
                 ),
                 html.Br(),
+                # The Sankey diagram of every plot type, shown by the selector in the browser
+                dcc.Store(id="sankey-store"),
                 dcc.Graph(id="sankey-di", style={"height": "70vh", "width": "100%"}),
             ]
         ),
     ],
 )
 
-# Define the callback
-@app.callback(
-    # Outputs
-    Output("route-map", "figure"),
-    Output("box-plot", "figure"),
-    Output("sankey-di", "figure"),
-    # Inputs
-    Input("year-dropdown", "value"),
-    Input("source-city-dropdown", "value"),
-    Input("destination-city-dropdown", "value"),
-    Input("source-dest-btn", "on"),
-    Input("route-dropdown", "value"),
-    Input("sankey-selector", "value"),
+# Colors used for cities on the map and the Sankey diagram
+color_scale = px.colors.qualitative.Plotly
+
+# Discrete colorscale giving a marker with color i the color color_scale[i], so markers send indices instead of colors
+COLOR_SCALE_MARKER = dict(
+    colorscale=[[i / (len(color_scale) - 1), color] for i, color in enumerate(color_scale)],
+    cmin=0,
+    cmax=len(color_scale) - 1,
 )
-def update_graph(
-    year_selected,
-    source_city_selected,
-    destination_city_selected,
-    is_dest,
-    selected_routes,
-    sankey_selector,
-):
-
-    # Default selections for filters
-    if year_selected is None or len(year_selected) == 0:
-        year_selected = df_graphs["Year"].unique()
-    if source_city_selected is None or len(source_city_selected) == 0:
-        source_city_selected = df_graphs["city1"].unique()
-    if destination_city_selected is None or len(destination_city_selected) == 0:
-        destination_city_selected = df_graphs["city2"].unique()
-
-    # Filter the data
-    df_graphs_year = df_graphs[
-        df_graphs["Year"].isin(year_selected)
-        & df_graphs["city1"].isin(source_city_selected)
-        & df_graphs["city2"].isin(destination_city_selected)
-    ]
+
+
+# Helper function to get the hover template of the city markers, filled by plotly.js from the
+# marker's city (text), airport (hovertext) and numbers (customdata)
+def marker_hovertemplate(direction):
+    return (
+        f"{direction}: %{{text}}<br>Total Flights: %{{customdata[0]}}"
+        "<br>Avg. Passengers: %{customdata[1]:.0f}<br>Airport: %{hovertext}<extra></extra>"
+    )
+
+# Filtered and grouped data shared by the map, box plot and Sankey callbacks. Only the row positions
+# of the selection are kept, not a copy of its rows, see routes
+class FilteredView(namedtuple("FilteredView", ["positions", "sources", "destinations", "source_city_colors"])):
+    __slots__ = ()
+
+    @property
+    def routes(self):
+        """Rows of the selection, taken from df_graphs when needed."""
+        return df_graphs if self.positions is None else df_graphs.iloc[self.positions]
+
+
+# Helper function to turn a dropdown value into an order-insensitive, hashable key
+def normalize_selection(selected):
+    if not selected:
+        return ()
+    return tuple(sorted(set(selected)))
+
+
+# Helper function to get the filtered view for a selection, computed once per selection
+def get_filtered_view(year_selected, source_city_selected, destination_city_selected):
+    return compute_filtered_view(
+        normalize_selection(year_selected),
+        normalize_selection(source_city_selected),
+        normalize_selection(destination_city_selected),
+    )
+
+
+# The returned frames are shared between callbacks and must not be modified. Cached views hold the
+# row positions and the per-city aggregates of a selection, their size is bounded by the row count
+# and the number of cities, not by the columns of df_graphs
+@lru_cache(maxsize=32)
+@metrics.stage("aggregate")
+def compute_filtered_view(year_selected, source_city_selected, destination_city_selected):
+    # Filter the data, empty selections match every row
+    with metrics.stage("filter"):
+        positions = filter_positions(
+            {
+                "Year": year_selected,
+                "city1": source_city_selected,
+                "city2": destination_city_selected,
+            }
+        )
+        df_graphs_year = df_graphs if positions is None else df_graphs.iloc[positions]
 
     # Group data by city and aggregate necessary fields
     df_graphs_source = (
-        df_graphs_year.groupby(["city1", "start_lat", "start_lon"])
+        df_graphs_year.groupby(["city1", "start_lat", "start_lon"], observed=True)
         .agg(
             {
                 "passengers": "mean",
@@ -355,19 +634,9 @@ def update_graph(
 
     # Merge the flight count back to the aggregated data
     df_graphs_source = df_graphs_source.merge(source_flight_count, on="city1", how="left")
-    df_graphs_source["hover_text"] = (
-        "From: "
-        + df_graphs_source["city1"]
-        + "<br>Total Flights: "
-        + df_graphs_source["flight_count"].astype(str)
-        + "<br>Avg. Passengers: "
-        + df_graphs_source["passengers"].round().astype(str)
-        + "<br>Airport: "
-        + df_graphs_source["airport_1"]
-    )
 
     df_graphs_dest = (
-        df_graphs_year.groupby(["city2", "end_lat", "end_lon"])
+        df_graphs_year.groupby(["city2", "end_lat", "end_lon"], observed=True)
         .agg(
             {
                 "passengers": "mean",
@@ -382,82 +651,86 @@ def update_graph(
 
     df_graphs_dest = df_graphs_dest.merge(dest_flight_count, on="city2", how="left")
 
-    df_graphs_dest["hover_text"] = (
-        "To: "
-        + df_graphs_dest["city2"]
-        + "<br>Total Flights: "
-        + df_graphs_dest["flight_count"].astype(str)
-        + "<br>Avg. Passengers: "
-        + df_graphs_dest["passengers"].round().astype(str)
-        + "<br>Airport: "
-        + df_graphs_dest["airport_2"]
-    )
-
+    # Colors of the route lines, the city markers use the same colors by index
     unique_source_cities = df_graphs_source["city1"].unique()
-    unique_dest_cities = df_graphs_dest["city2"].unique()
-    color_scale = px.colors.qualitative.Plotly
     source_city_colors = {
         city: color_scale[i % len(color_scale)]
         for i, city in enumerate(unique_source_cities)
     }
-    dest_city_colors = {
-        city: color_scale[i % len(color_scale)]
-        for i, city in enumerate(unique_dest_cities)
-    }
 
-    # Map figure
+    return FilteredView(positions, df_graphs_source, df_graphs_dest, source_city_colors)
+
+
+# Helper function to scale the city markers, the busiest city gets a 25 pixel diameter
+def marker_sizeref(flight_counts):
+    return 2.0 * max(flight_counts, default=1) / (25.0**2)
+
+
+# Route map of a selection, with the traces of both directions. The "source-dest-btn" switch
+# shows those of one direction in the browser, see assets/graphs.js
+@graphs_cache.memoize("route-map")
+@metrics.stage("figure")
+def update_route_map(year_selected, source_city_selected, destination_city_selected):
+    view = get_filtered_view(year_selected, source_city_selected, destination_city_selected)
+    df_graphs_year = view.routes
+    df_graphs_source = view.sources
+    df_graphs_dest = view.destinations
+    source_city_colors = view.source_city_colors
+
+    # Map figure, its traces are tagged with the direction they belong to in their meta
     map_fig = go.Figure()
 
-    if is_dest:
-        map_fig.add_trace(
-            go.Scattergeo(
-                locationmode="USA-states",
-                lon=df_graphs_dest["end_lon"],
-                lat=df_graphs_dest["end_lat"],
-                hoverinfo="text",
-                text=df_graphs_dest["hover_text"],
-                mode="markers",
-                marker=dict(
-                    size=df_graphs_dest["flight_count"],
-                    sizemode="area",
-                    sizeref=2.0 * max(df_graphs_dest["flight_count"]) / (25.0**2),
-                    color="rgba(0, 0, 0, 0)",  # Transparent fill color
-                    line=dict(
-                        color=[dest_city_colors[city] for city in df_graphs_dest["city2"]],
-                        width=2,  # Set the width of the circle outline
-                    ),
-                ),
-            )
+    # Source cities and their routes, shown by default
+    map_fig.add_trace(
+        go.Scattergeo(
+            locationmode="USA-states",
+            lon=df_graphs_source["start_lon"],
+            lat=df_graphs_source["start_lat"],
+            text=df_graphs_source["city1"].astype(str),
+            hovertext=df_graphs_source["airport_1"].astype(str),
+            customdata=df_graphs_source[["flight_count", "passengers"]].to_numpy(np.float32),
+            hovertemplate=marker_hovertemplate("From"),
+            mode="markers",
+            marker=dict(
+                size=df_graphs_source["flight_count"],
+                sizemode="area",
+                sizeref=marker_sizeref(df_graphs_source["flight_count"]),
+                # Same colors as source_city_colors, by index into the color_scale
+                color=pd.factorize(df_graphs_source["city1"])[0] % len(color_scale),
+                **COLOR_SCALE_MARKER,
+            ),
         )
-    else:
-        map_fig.add_trace(
-            go.Scattergeo(
-                locationmode="USA-states",
-                lon=df_graphs_source["start_lon"],
-                lat=df_graphs_source["start_lat"],
-                hoverinfo="text",
-                text=df_graphs_source["hover_text"],
-                mode="markers",
-                marker=dict(
-                    size=df_graphs_source["flight_count"],
-                    sizemode="area",
-                    sizeref=2.0 * max(df_graphs_source["flight_count"]) / (25.0**2),
-                    color=[source_city_colors[city] for city in df_graphs_source["city1"]],
+    )
+    map_fig.add_traces(create_route_line_traces(df_graphs_year, source_city_colors))
+    map_fig.update_traces(meta="source")
+
+    # Destination cities
+    map_fig.add_trace(
+        go.Scattergeo(
+            locationmode="USA-states",
+            lon=df_graphs_dest["end_lon"],
+            lat=df_graphs_dest["end_lat"],
+            text=df_graphs_dest["city2"].astype(str),
+            hovertext=df_graphs_dest["airport_2"].astype(str),
+            customdata=df_graphs_dest[["flight_count", "passengers"]].to_numpy(np.float32),
+            hovertemplate=marker_hovertemplate("To"),
+            mode="markers",
+            marker=dict(
+                size=df_graphs_dest["flight_count"],
+                sizemode="area",
+                sizeref=marker_sizeref(df_graphs_dest["flight_count"]),
+                color="rgba(0, 0, 0, 0)",  # Transparent fill color
+                line=dict(
+                    # Colors by index into the color_scale, one per destination city
+                    color=pd.factorize(df_graphs_dest["city2"])[0] % len(color_scale),
+                    **COLOR_SCALE_MARKER,
+                    width=2,  # Set the width of the circle outline
                 ),
-            )
+            ),
+            meta="destination",
+            visible=False,
         )
-
-        for i, row in df_graphs_year.iterrows():
-            map_fig.add_trace(
-                go.Scattergeo(
-                    locationmode="USA-states",
-                    lon=[row["start_lon"], row["end_lon"], None],
-                    lat=[row["start_lat"], row["end_lat"], None],
-                    mode="lines",
-                    line=dict(width=1, color=source_city_colors[row["city1"]]),
-                    opacity=0.5,
-                )
-            )
+    )
 
     map_fig.update_layout(
         title={
@@ -484,24 +757,71 @@ def update_graph(
         margin=dict(l=0, r=0, t=0, b=0),  # Removes extra margins
     )
 
+    return encode_figure(map_fig)
+
+
+# The switch shows the stored traces of one direction in the browser, without a server round trip
+app.clientside_callback(
+    ClientsideFunction(namespace="graphs", function_name="routeMap"),
+    Output("route-map", "figure"),
+    Input("route-map-store", "data"),
+    Input("source-dest-btn", "on"),
+)
+
+
+# Callback for the options of the route dropdown, searched on the server as the user types
+@app.callback(
+    Output("route-dropdown", "options"),
+    Input("route-dropdown", "search_value"),
+    State("route-dropdown", "value"),
+)
+def update_route_options(search_value, selected_routes):
+    # The selected routes stay in the options, otherwise the dropdown would drop them
+    routes = dict.fromkeys((selected_routes or []) + search_routes(search_value))
+    return [{"label": route, "value": route} for route in routes]
+
+
+# Fare box plot of a selection. The boxes follow the order of the selected routes, so the cache
+# keeps that order
+@graphs_cache.memoize("box-plot", ordered=(3,))
+@metrics.stage("figure")
+def update_box_plot(year_selected, source_city_selected, destination_city_selected, selected_routes):
+    df_graphs_year = get_filtered_view(
+        year_selected, source_city_selected, destination_city_selected
+    ).routes
+
     # Box Plot
     if selected_routes is None or len(selected_routes) == 0:
         selected_routes = (
-            df_graphs_year.groupby("route")["fare"].mean().nlargest(3).index.tolist()
+            df_graphs_year.groupby("route", observed=True)["fare"].mean().nlargest(3).index.tolist()
         )  # Default to top 3 if none selected
-        filtered_data = df_graphs_year[df_graphs_year["route"].isin(selected_routes)].copy()
         box_title = "Fare Distribution of Top Route(s)"
     else:
-        filtered_data = df_graphs[df_graphs["route"].isin(selected_routes)].copy()
         box_title = "Fare Distribution by Selected Routes"
 
-    box_plot_fig = px.box(
-        filtered_data,
-        x="route",
-        y="fare",
-        color="route",
-        title=box_title,
+    # Merge the fare sketches of each route over the selected years
+    buckets, summary = merge_sketches(
+        select_sketches(fare_sketches, route=selected_routes, Year=normalize_selection(year_selected)), ["route"]
     )
+    summary = summary.set_index(summary["route"].astype(str))
+
+    # One box per route drawn from its quartiles and fences, in the order the routes were selected
+    box_plot_fig = go.Figure()
+    routes = [route for route in dict.fromkeys(map(str, selected_routes)) if route in summary.index]
+    for i, route in enumerate(routes):
+        statistics = box_statistics(
+            buckets[buckets["route"] == route], summary.at[route, "Min"], summary.at[route, "Max"]
+        )
+        box_plot_fig.add_trace(
+            go.Box(
+                x=[route],
+                name=route,
+                marker_color=color_scale[i % len(color_scale)],
+                **{key: [value] for key, value in statistics.items()},
+            )
+        )
+
+    box_plot_fig.update_layout(title_text=box_title)
     box_plot_fig.update_layout(
         yaxis_title="Fare ($)",
         paper_bgcolor="rgba(150, 150, 150, 0.5)",
@@ -521,50 +841,32 @@ def update_graph(
             showticklabels=False,
         ),
         margin=dict(r=20),
-    ),
+    )
 
-    ## Sankey Diagram
+    return encode_figure(box_plot_fig)
 
-    # Map city names to indices
-    all_cities = list(set(df_graphs_year["city1"]).union(set(df_graphs_year["city2"])))
-    city_to_index = {city: i for i, city in enumerate(all_cities)}
 
-    # Assign colors to each city from the color_scale
-    node_colors = {
-        city: color_scale[i % len(color_scale)] for i, city in enumerate(all_cities)
-    }
+# Column, aggregation, hover label and title of each sankey-selector option
+SANKEY_OPTIONS = {
+    "psg": ("passengers", "sum", "Passengers", "Passenger Flow Between Cities"),
+    "fare_lg": ("fare_lg", "mean", "Fare (Large Carrier)", "Fare (Large Carrier) Flow Between Cities"),
+    "fare_low": ("fare_low", "mean", "Fare (Low Carrier)", "Fare (Low Carrier) Flow Between Cities"),
+}
 
-    # Set link colors to match source node colors
-    link_colors = [node_colors[df_graphs_year["city1"].iloc[i]] for i in range(len(df_graphs_year))]
 
-    # Define nodes and links for Sankey diagram
-    node_labels = all_cities  # Labels for the Sankey nodes (unique cities)
+# Helper function to draw the Sankey diagram of the filtered rows for one sankey-selector option
+def create_sankey_figure(df_graphs_year, sankey_selector):
+    column, how, hover_label, sankey_title = SANKEY_OPTIONS[sankey_selector]
 
-    # Convert DataFrame into sources, targets, and values for the Sankey plot
-    sources = [city_to_index[city] for city in df_graphs_year["city1"]]
-    targets = [city_to_index[city] for city in df_graphs_year["city2"]]
-    
-    if sankey_selector == "psg":
-        values = df_graphs_year["passengers"].tolist()
-        sankey_title = "Passenger Flow Between Cities"
-    elif sankey_selector == "fare_lg":
-        values = df_graphs_year["fare_lg"].tolist()
-        sankey_title = "Fare (Large Carrier) Flow Between Cities"
-    elif sankey_selector == "fare_low":
-        values = df_graphs_year["fare_low"].value_counts().tolist()
-        sankey_title = "Fare (Large Carrier) Flow Between Cities"
-    else:
-        values = df_graphs_year["passengers"].tolist()
-        sankey_title = "Passenger Flow Between Cities"
-
-    # Define a label for the hover text based on the sankey_selector
-    hover_label = {
-        "psg": "Passengers",
-        "fare_lg": "Fare (Large Carrier)",
-        "fare_low": "Fare (Low Carrier)",
-    }.get(sankey_selector, "Passengers")  # Default to "Passengers" if no match
+    links = create_sankey_links(df_graphs_year, column, how)
 
+    # Node indices are the codes of the cities over sources and targets together
+    codes, node_labels = pd.factorize(pd.concat([links["city1"], links["city2"]], ignore_index=True))
+    sources, targets = codes[:len(links)], codes[len(links):]
 
+    # Assign colors to each city from the color_scale, links take the color of their source
+    node_colors = np.array(color_scale)[np.arange(len(node_labels)) % len(color_scale)]
+    link_colors = node_colors[sources]
 
     # Create Sankey figure
     sankey_fig = go.Figure(
@@ -575,17 +877,17 @@ def update_graph(
                     pad=15,
                     thickness=20,
                     line=dict(color="black", width=0.5),
-                    label=node_labels,  # City names
-                    color=[node_colors[city] for city in node_labels],  # Node colors
+                    label=list(node_labels),  # City names
+                    color=list(node_colors),  # Node colors
                 ),
                 link=dict(
                     source=sources,  # Indices of source cities
                     target=targets,  # Indices of target cities
-                    value=values,  # Number of passengers
-                    color=link_colors,  # Color of the links
+                    value=links["value"].to_numpy(),  # Passengers or mean fare of each city pair
+                    color=list(link_colors),  # Color of the links
                     hovertemplate="From: %{source.label}<br />"
-                    +"To: %{target.label}<br />"
-                    + "{hover_label}: %{value}<br />"
+                    + "To: %{target.label}<br />"
+                    + f"{hover_label}: %{{value}}<br />"
                 ),
             )
         ]
@@ -596,28 +898,239 @@ def update_graph(
         font_size=12,
     )
 
-    return map_fig, box_plot_fig, sankey_fig
+    return encode_figure(sankey_fig)
+
+
+# Sankey diagrams of a selection for every plot type. The selector shows one of them in the
+# browser, see assets/graphs.js
+@graphs_cache.memoize("sankey-di")
+@metrics.stage("figure")
+def update_sankey(year_selected, source_city_selected, destination_city_selected):
+    df_graphs_year = get_filtered_view(
+        year_selected, source_city_selected, destination_city_selected
+    ).routes
+
+    return {option: create_sankey_figure(df_graphs_year, option) for option in SANKEY_OPTIONS}
+
+
+# The selector shows the stored diagram of its plot type in the browser, without a server round trip
+app.clientside_callback(
+    ClientsideFunction(namespace="graphs", function_name="sankey"),
+    Output("sankey-di", "figure"),
+    Input("sankey-store", "data"),
+    Input("sankey-selector", "value"),
+)
+
+
+# Helper function to count the rows left by the filters of a callback request. They are recorded
+# here, once per request, as the filtered views and figures of cached selections are not computed
+def filtered_rows(year_selected, source_city_selected, destination_city_selected):
+    rows = count_filtered_rows(year_selected, source_city_selected, destination_city_selected)
+    metrics.observe("dash_callback_filtered_rows", rows)
+    return rows
+
+
+# Helper function to check whether a figure is left to the background callback: the figures
+# of heavy selections, until they are cached
+def runs_in_background(name, args, rows):
+    return rows >= BACKGROUND_MIN_ROWS and not graphs_cache.contains(name, args)
+
+
+# Callback for the route map of cheap selections and of cached figures
+@app.callback(
+    Output("route-map-store", "data"),
+    Input("year-dropdown", "value"),
+    Input("source-city-dropdown", "value"),
+    Input("destination-city-dropdown", "value"),
+)
+def update_route_map_store(year_selected, source_city_selected, destination_city_selected):
+    args = (year_selected, source_city_selected, destination_city_selected)
+    if runs_in_background("route-map", args, filtered_rows(*args)):
+        raise PreventUpdate
+    return update_route_map(*args)
+
+
+# Callback for the box plot of cheap selections and of cached figures
+@app.callback(
+    Output("box-plot", "figure"),
+    Input("year-dropdown", "value"),
+    Input("source-city-dropdown", "value"),
+    Input("destination-city-dropdown", "value"),
+    Input("route-dropdown", "value"),
+)
+def update_box_plot_figure(year_selected, source_city_selected, destination_city_selected, selected_routes):
+    args = (year_selected, source_city_selected, destination_city_selected, selected_routes)
+    if runs_in_background("box-plot", args, filtered_rows(*args[:3])):
+        raise PreventUpdate
+    return update_box_plot(*args)
+
+
+# Callback for the Sankey diagrams of cheap selections and of cached figures
+@app.callback(
+    Output("sankey-store", "data"),
+    Input("year-dropdown", "value"),
+    Input("source-city-dropdown", "value"),
+    Input("destination-city-dropdown", "value"),
+)
+def update_sankey_store(year_selected, source_city_selected, destination_city_selected):
+    args = (year_selected, source_city_selected, destination_city_selected)
+    if runs_in_background("sankey-di", args, filtered_rows(*args)):
+        raise PreventUpdate
+    return update_sankey(*args)
+
+
+# Callback handing the heavy selections with figures left to compute to the background callback
+@app.callback(
+    Output("graphs-background-selection", "data"),
+    Input("year-dropdown", "value"),
+    Input("source-city-dropdown", "value"),
+    Input("destination-city-dropdown", "value"),
+    Input("route-dropdown", "value"),
+)
+def route_graphs_selection(year_selected, source_city_selected, destination_city_selected, selected_routes):
+    selection = [year_selected, source_city_selected, destination_city_selected, selected_routes]
+    rows = filtered_rows(*selection[:3])
+    if not (
+        runs_in_background("route-map", selection[:3], rows)
+        or runs_in_background("box-plot", selection, rows)
+        or runs_in_background("sankey-di", selection[:3], rows)
+    ):
+        raise PreventUpdate
+    return selection
+
+
+# Callback computing the figures of a heavy selection in a subprocess, so that the worker serves
+# other requests meanwhile. Newer input of the session, or leaving the page, kills the subprocess
+@app.callback(
+    Output("route-map-store", "data", allow_duplicate=True),
+    Output("box-plot", "figure", allow_duplicate=True),
+    Output("sankey-store", "data", allow_duplicate=True),
+    Input("graphs-background-selection", "data"),
+    background=True,
+    # Milliseconds between the polls of the browser for the progress and the result
+    interval=500,
+    running=[
+        (
+            Output("graphs-progress-container", "style"),
+            {"display": "block", "margin-top": "10px"},
+            {"display": "none"},
+        ),
+    ],
+    progress=[
+        Output("graphs-progress", "value"),
+        Output("graphs-progress", "max"),
+        Output("graphs-progress", "label"),
+    ],
+    progress_default=[0, 1, ""],
+    cancel=[
+        Input("year-dropdown", "value"),
+        Input("source-city-dropdown", "value"),
+        Input("destination-city-dropdown", "value"),
+        Input("route-dropdown", "value"),
+        Input("url", "pathname"),
+    ],
+    prevent_initial_call=True,
+)
+def update_graphs_in_background(set_progress, selection):
+    year_selected, source_city_selected, destination_city_selected, selected_routes = selection
+    args = (year_selected, source_city_selected, destination_city_selected)
+    steps = [
+        ("Filtering the flights", lambda: get_filtered_view(*args)),
+        ("Drawing the route map", lambda: update_route_map(*args)),
+        ("Drawing the box plot", lambda: update_box_plot(*args, selected_routes)),
+        ("Drawing the Sankey diagrams", lambda: update_sankey(*args)),
+    ]
+    results = []
+    try:
+        for i, (label, step) in enumerate(steps):
+            set_progress((i, len(steps), label))
+            results.append(step())
+    finally:
+        # The subprocess exits with the job, its metrics and cache counters are added to the stores before
+        metrics_store.flush()
+        graphs_cache.flush()
+    # The figures are cached by now, the next requests for them are served right away
+    return results[1:]
+
+
+# Source cities whose Graphs figures are precomputed after start-up, separated by ";". When unset,
+# the WARMUP_TOP_CITIES busiest ones by passengers
+WARMUP_CITIES = [city.strip() for city in os.environ.get("WARMUP_CITIES", "").split(";") if city.strip()]
+WARMUP_TOP_CITIES = int(os.environ.get("WARMUP_TOP_CITIES", 5))
+
+
+# Helper function to list the Graphs selections precomputed after start-up: the default view of
+# every year and city, then each of the popular source cities on its own
+def warmup_selections():
+    cities = WARMUP_CITIES or (
+        df_graphs.groupby("city1", observed=True)["passengers"].sum()
+        .nlargest(WARMUP_TOP_CITIES).index.astype(str).tolist()
+    )
+    return [(None, None, None)] + [(None, [city], None) for city in cities]
+
+
+# Helper function to compute the figures of a selection as its callbacks do when the page opens
+def warm_selection(year_selected, source_city_selected, destination_city_selected):
+    args = (year_selected, source_city_selected, destination_city_selected)
+    update_route_map(*args)
+    update_box_plot(*args, None)
+    update_sankey(*args)
+
+
+# The figures of the popular selections are cached before the worker reports itself ready on
+# /ready, see warmup.py. gunicorn starts it in every worker, see gunicorn.conf.py
+graphs_warmup = Warmup(
+    lambda: {
+        "; ".join(selection[1] or ["all"]): partial(warm_selection, *selection)
+        for selection in warmup_selections()
+    }
+)
+
+
+# Readiness of the worker, 503 until its warmup is done. The pid tells the workers apart
+@app.server.route("/ready")
+def ready():
+    status = dict(graphs_warmup.status(), pid=os.getpid())
+    return status, 200 if status["ready"] else 503
+
+
+# Hit and miss counters of the figure cache, summed over all workers
+@app.server.route("/cache-stats")
+def cache_stats():
+    return graphs_cache.stats()
+
+
+# Callback metrics in the Prometheus text format
+@app.server.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics_store.render(), content_type=metrics.CONTENT_TYPE)
 
 
 ########################################################################################
 
 # Calculate unique counts and titles dynamically
-unique_counts = {
-    "Unique Year Count": df['Year'].nunique(),
-    "Unique Quarter Count": df['Quarter'].nunique(),
-    "Unique Cities Count": len(pd.concat([df['OriginCity'], df['DestinationCity']]).unique()),
-    "Unique OriginCity Count": df['OriginCity'].nunique(),
-    "Unique DestinationCity Count": df['DestinationCity'].nunique(),
-    "Unique Airports Count": len(pd.concat([df['OriginAirportCode'], df['DestinationAirportCode']]).unique()),
-    "Unique OriginAirportCode Count": df['OriginAirportCode'].nunique(),
-    "Unique DestinationAirportCode Count": df['DestinationAirportCode'].nunique(),
-    "Unique Carrier Codes Count": len(pd.concat([df['LargestCarrierCode'], df['LowestFareCarrierCode']]).unique()),
-    "Unique LargestCarrierCode Count": df['LargestCarrierCode'].nunique(),
-    "Unique LowestFareCarrierCode Count": df['LowestFareCarrierCode'].nunique(),
-    "Unique Routes Count": df['Route'].nunique(),
-    "Total Records Count": len(df),
-    "Total Passenger Count": df['PassengerCount'].sum()
-}
+@page_cache.memoize("unique-counts")
+@metrics.stage("aggregate")
+def compute_unique_counts():
+    star = load_star_schema()
+    facts = star.facts['quarters']
+    return {
+        "Unique Year Count": facts['Year'].nunique(),
+        "Unique Quarter Count": facts['Quarter'].nunique(),
+        "Unique Cities Count": distinct_count(star, 'OriginCity', 'DestinationCity'),
+        "Unique OriginCity Count": distinct_count(star, 'OriginCity'),
+        "Unique DestinationCity Count": distinct_count(star, 'DestinationCity'),
+        "Unique Airports Count": distinct_count(star, 'OriginAirportCode', 'DestinationAirportCode'),
+        "Unique OriginAirportCode Count": distinct_count(star, 'OriginAirportCode'),
+        "Unique DestinationAirportCode Count": distinct_count(star, 'DestinationAirportCode'),
+        "Unique Carrier Codes Count": distinct_count(star, 'LargestCarrierCode', 'LowestFareCarrierCode'),
+        "Unique LargestCarrierCode Count": distinct_count(star, 'LargestCarrierCode'),
+        "Unique LowestFareCarrierCode Count": distinct_count(star, 'LowestFareCarrierCode'),
+        "Unique Routes Count": distinct_count(star, 'Route'),
+        # Every row of the dataset has a fare, so the fare counts add up to the row count
+        "Total Records Count": facts['FareCount'].sum(),
+        "Total Passenger Count": facts['PassengerCount'].sum()
+    }
 
 # Helper function to create an indicator graph with responsive height
 def create_indicator(value, title):
@@ -645,26 +1158,30 @@ def create_card(title, value):
         style={"height": "200px"}  # Fixed height for the card
     )
 
-# Dynamic Data Summary Layout
-data_summary_layout = dbc.Container([
-    html.H1("Data Summary", className="text-center my-4", style={"color": "#1d3557"}),
+# Dynamic Data Summary Layout, built on first access
+@lru_cache(maxsize=None)
+def get_data_summary_layout():
+    return dbc.Container([
+        html.H1("Data Summary", className="text-center my-4", style={"color": "#1d3557"}),
 
-    # Generate cards for each unique count dynamically
-    dbc.Row(
-        [
-            dbc.Col(create_card(title, value), md=4)
-            for title, value in unique_counts.items()
-        ],
-        className="mb-4"
-    )
-], fluid=True)
+        # Generate cards for each unique count dynamically
+        dbc.Row(
+            [
+                dbc.Col(create_card(title, value), md=4)
+                for title, value in compute_unique_counts().items()
+            ],
+            className="mb-4"
+        )
+    ], fluid=True)
 
-# Helper function to generate top 10 graphs
-def generate_top_10_figures():
+# Helper function to generate top 10 graphs from the star schema
+@profiling.profiled("top-10-figures")
+@metrics.stage("figure")
+def generate_top_10_figures(star):
     figures = []
 
     # Top 10 Cities by Arrivals
-    top_arrival_cities = df.groupby('DestinationCity')['PassengerCount'].sum().reset_index()
+    top_arrival_cities = passenger_sum(star, 'DestinationCity')
     top_arrival_cities = top_arrival_cities.sort_values(by='PassengerCount').tail(10)
     fig5 = px.bar(top_arrival_cities, x='PassengerCount', y='DestinationCity', orientation='h',
                   title="Top 10 Busiest Cities by Arrivals (Passenger Count)",
@@ -673,7 +1190,7 @@ def generate_top_10_figures():
     figures.append(fig5)
 
     # Top 10 Cities by Departures
-    top_departure_cities = df.groupby('OriginCity')['PassengerCount'].sum().reset_index()
+    top_departure_cities = passenger_sum(star, 'OriginCity')
     top_departure_cities = top_departure_cities.sort_values(by='PassengerCount').tail(10)
     fig6 = px.bar(top_departure_cities, x='PassengerCount', y='OriginCity', orientation='h',
                   title="Top 10 Busiest Cities by Departures (Passenger Count)",
@@ -682,7 +1199,7 @@ def generate_top_10_figures():
     figures.append(fig6)
 
     # Top 10 Airports by Arrivals
-    top_arrival_airports = df.groupby('DestinationAirportCode')['PassengerCount'].sum().reset_index()
+    top_arrival_airports = passenger_sum(star, 'DestinationAirportCode')
     top_arrival_airports = top_arrival_airports.sort_values(by='PassengerCount').tail(10)
     fig7 = px.bar(top_arrival_airports, x='PassengerCount', y='DestinationAirportCode', orientation='h',
                   title="Top 10 Busiest Airports by Arrivals (Passenger Count)",
@@ -691,7 +1208,7 @@ def generate_top_10_figures():
     figures.append(fig7)
 
     # Top 10 Airports by Departures
-    top_departure_airports = df.groupby('OriginAirportCode')['PassengerCount'].sum().reset_index()
+    top_departure_airports = passenger_sum(star, 'OriginAirportCode')
     top_departure_airports = top_departure_airports.sort_values(by='PassengerCount').tail(10)
     fig8 = px.bar(top_departure_airports, x='PassengerCount', y='OriginAirportCode', orientation='h',
                   title="Top 10 Busiest Airports by Departures (Passenger Count)",
@@ -700,7 +1217,7 @@ def generate_top_10_figures():
     figures.append(fig8)
 
     # Top 10 Routes by Passenger Count
-    top_routes = df.groupby('Route')['PassengerCount'].sum().reset_index()
+    top_routes = passenger_sum(star, 'Route')
     top_routes = top_routes.sort_values(by='PassengerCount').tail(10)
     fig9 = px.bar(top_routes, x='PassengerCount', y='Route', orientation='h',
                   title="Top 10 Busiest Routes by Passenger Count",
@@ -709,15 +1226,15 @@ def generate_top_10_figures():
     figures.append(fig9)
 
     # Top 10 Longest Routes
-    unique_routes_df = df.drop_duplicates(subset=['Route'])
-    top_longest_routes = unique_routes_df.sort_values(by='RouteDistanceInMiles').tail(10)
+    unique_routes_df = route_distances(star)
+    top_longest_routes = unique_routes_df.tail(10)
     fig10 = px.bar(top_longest_routes, x='RouteDistanceInMiles', y='Route', orientation='h',
                    title="Top 10 Longest Routes by Distance (Miles)", color_discrete_sequence=['teal'])
     fig10.update_layout(title_font_size=20, xaxis_title="Route Distance (Miles)", yaxis_title="Route")
     figures.append(fig10)
 
     # Top 10 Shortest Routes
-    top_shortest_routes = unique_routes_df.sort_values(by='RouteDistanceInMiles').head(10)
+    top_shortest_routes = unique_routes_df.head(10)
     fig11 = px.bar(top_shortest_routes, x='RouteDistanceInMiles', y='Route', orientation='h',
                    title="Top 10 Shortest Routes by Distance (Miles)", color_discrete_sequence=['salmon'])
     fig11.update_layout(title_font_size=20, xaxis_title="Route Distance (Miles)", yaxis_title="Route")
@@ -726,28 +1243,34 @@ def generate_top_10_figures():
     return figures
 
 # Generate the figures for top 10 graphs
-top_10_figures = generate_top_10_figures()
-
-# Layout for Top 10 Graphs Page
-top_10_layout = html.Div([
-    html.H1("Top 10 Data Visualizations", className="text-center my-4", style={"color": "#1d3557"}),
-
-    dbc.Container([
-        dbc.Row(
-            [
-                dbc.Col([dcc.Graph(figure=fig), html.Hr(style={"border-top": "5px solid #ddd"})], md=12) for fig in top_10_figures
-            ],
-            className="g-4"
-        )
+@page_cache.memoize("top-10")
+def get_top_10_figures():
+    return generate_top_10_figures(load_star_schema())
+
+# Layout for Top 10 Graphs Page, built on first access
+@lru_cache(maxsize=None)
+def get_top_10_layout():
+    return html.Div([
+        html.H1("Top 10 Data Visualizations", className="text-center my-4", style={"color": "#1d3557"}),
+
+        dbc.Container([
+            dbc.Row(
+                [
+                    dbc.Col([dcc.Graph(figure=fig), html.Hr(style={"border-top": "5px solid #ddd"})], md=12) for fig in get_top_10_figures()
+                ],
+                className="g-4"
+            )
+        ])
     ])
-])
 
-# Trend Graph Definitions
-def create_trend_figures(df):
+# Trend Graph Definitions, built from the star schema
+@profiling.profiled("trend-figures")
+@metrics.stage("figure")
+def create_trend_figures(star):
     figures = []
 
     # Passenger Count by Year with Average Line
-    passenger_count_by_year = df.groupby('Year')['PassengerCount'].sum().reset_index()
+    passenger_count_by_year = passenger_sum(star, 'Year')
     average_count = passenger_count_by_year['PassengerCount'].mean()
     fig1 = px.line(passenger_count_by_year, x='Year', y='PassengerCount', title="Passengers Trend Over Years")
     fig1.update_traces(mode='lines+markers', line=dict(color='gray'))
@@ -758,8 +1281,11 @@ def create_trend_figures(df):
     figures.append(fig1)
 
     # Passenger Count Trends by Distance Category
-    df['DistanceCategory'] = pd.cut(df['RouteDistanceInMiles'], bins=[0, 500, 1500, 3000], labels=['Short', 'Medium', 'Long'])
-    trend_data = df.groupby(['Year', 'DistanceCategory'])['PassengerCount'].sum().reset_index()
+    trend_data = (
+        star.facts['distance_categories'].groupby(['Year', 'DistanceCategory'], observed=False)['PassengerCount']
+        .sum()
+        .reset_index()
+    )
     distance_colors = {"Short": "dodgerblue", "Medium": "orange", "Long": "green"}
     fig2 = px.line(trend_data, x='Year', y='PassengerCount', color='DistanceCategory',
                    title="Passenger Count Trends by Route Distance Category Over Time",
@@ -767,7 +1293,7 @@ def create_trend_figures(df):
     figures.append(fig2)
 
     # Yearly Trend of Passenger Count with Annotations
-    passenger_trend = df.groupby('Year')['PassengerCount'].sum().reset_index()
+    passenger_trend = passenger_sum(star, 'Year')
     fig3 = px.line(passenger_trend, x='Year', y='PassengerCount', title="Yearly Trend of Passenger Count",
                    line_shape='spline', markers=True)
     peak_year = passenger_trend.loc[passenger_trend['PassengerCount'].idxmax()]
@@ -777,7 +1303,7 @@ def create_trend_figures(df):
     figures.append(fig3)
 
     # Yearly Trend of Average Fare with Annotations
-    fare_trend = df.groupby('Year')['AverageFare'].mean().reset_index()
+    fare_trend = fare_mean(star, 'Year')
     fig4 = px.line(fare_trend, x='Year', y='AverageFare', title="Yearly Trend of Average Fare",
                    line_shape='spline', markers=True, color_discrete_sequence=['indianred'])
     peak_fare = fare_trend.loc[fare_trend['AverageFare'].idxmax()]
@@ -787,7 +1313,7 @@ def create_trend_figures(df):
     figures.append(fig4)
 
     # Passenger Count Trends by Quarter
-    quarterly_trends = df.groupby(['Year', 'Quarter']).agg({'PassengerCount': 'sum', 'AverageFare': 'mean'}).reset_index()
+    quarterly_trends = passenger_sum(star, ['Year', 'Quarter']).merge(fare_mean(star, ['Year', 'Quarter']))
     quarterly_trends['Quarter'] = "Q" + quarterly_trends['Quarter'].astype(str)
     quarter_colors = {"Q1": "royalblue", "Q2": "orange", "Q3": "green", "Q4": "red"}
     fig5 = px.line(quarterly_trends, x='Year', y='PassengerCount', color='Quarter',
@@ -804,21 +1330,25 @@ def create_trend_figures(df):
     return figures
 
 # Generate trend figures
-trend_figures = create_trend_figures(df)
-
-# Layout for Trend Analysis Page
-trend_layout = html.Div([
-    html.H1("Trend Analysis", className="text-center my-4", style={"color": "#1d3557"}),
-
-    dbc.Container([
-        dbc.Row(
-            [
-                dbc.Col([dcc.Graph(figure=fig), html.Hr(style={"border-top": "5px solid #ddd"})], md=12) for fig in trend_figures
-            ],
-            className="g-4"
-        )
+@page_cache.memoize("trend-analysis")
+def get_trend_figures():
+    return create_trend_figures(load_star_schema())
+
+# Layout for Trend Analysis Page, built on first access
+@lru_cache(maxsize=None)
+def get_trend_layout():
+    return html.Div([
+        html.H1("Trend Analysis", className="text-center my-4", style={"color": "#1d3557"}),
+
+        dbc.Container([
+            dbc.Row(
+                [
+                    dbc.Col([dcc.Graph(figure=fig), html.Hr(style={"border-top": "5px solid #ddd"})], md=12) for fig in get_trend_figures()
+                ],
+                className="g-4"
+            )
+        ])
     ])
-])
 
 # App Layout with Navigation
 app.layout = html.Div([
@@ -850,14 +1380,15 @@ def display_page(pathname):
     if pathname == "/graphs":
         return graphs_layout
     elif pathname == "/data-summary":
-        return data_summary_layout
+        return get_data_summary_layout()
     elif pathname == "/top-10":
-        return top_10_layout
+        return get_top_10_layout()
     elif pathname == "/trend-analysis":
-        return trend_layout
+        return get_trend_layout()
     else:
         return home_layout
 
 # Run the app
 if __name__ == "__main__":
+    graphs_warmup.start()
     app.run_server(debug=False)
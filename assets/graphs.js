@@ -0,0 +1,28 @@
+// Clientside callbacks of the Graphs page, see the callbacks using ClientsideFunction in app.py.
+// They re-project the figures stored by the server callbacks, so the display toggles of the page
+// are handled in the browser without a round trip to the server.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    graphs: {
+        // Show the traces of the stored route map tagged with the direction of the switch:
+        // the source cities and their routes, or the destination cities
+        routeMap: function (figure, isDest) {
+            if (!figure) {
+                return window.dash_clientside.no_update;
+            }
+            const direction = isDest ? "destination" : "source";
+            return Object.assign({}, figure, {
+                data: figure.data.map(function (trace) {
+                    return Object.assign({}, trace, {visible: trace.meta === direction});
+                }),
+            });
+        },
+
+        // Show the stored Sankey diagram of the selected plot type
+        sankey: function (figures, plotType) {
+            if (!figures) {
+                return window.dash_clientside.no_update;
+            }
+            return figures[plotType] || figures.psg;
+        },
+    },
+});
@@ -0,0 +1,434 @@
+import argparse
+import gzip
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import numpy as np
+from tabulate import tabulate
+
+from synthetic_data import DEFAULT_DATA_DIR, data_directory, data_environment, generate, is_generated
+
+# Directory of app.py and gunicorn.conf.py
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Pages a session navigates to, with how often; the Graphs page is where the users spend their time
+PAGES = {"/": 1, "/data-summary": 1, "/top-10": 1, "/trend-analysis": 1, "/graphs": 6}
+
+# Actions of a session on the Graphs page, with how often they are taken
+GRAPHS_ACTIONS = {
+    "years": 3, "source-cities": 3, "destination-cities": 2, "routes": 2,
+    "direction": 1, "sankey": 1, "navigate": 1,
+}
+
+# Most values picked at once in each multi-select dropdown
+MAX_SELECTED = {"year-dropdown": 3, "source-city-dropdown": 3, "destination-city-dropdown": 2, "route-dropdown": 3}
+
+
+class DashClient:
+    """HTTP client of one simulated user, keeping its connection open like a browser."""
+
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.host, self.port, self.timeout = parts.hostname, parts.port or 80, timeout
+        self.connection = None
+
+    def request(self, method, path, body=None):
+        headers = {"Accept-Encoding": "gzip"}
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+
+        # A kept-alive connection can be closed by the server between requests, it is reopened once
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request(method, path, body, headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.close()
+                if attempt:
+                    raise
+
+        if response.getheader("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        return response.status, data
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Stats:
+    """Latencies and errors of the requests of all the users, per callback."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.messages = defaultdict(int)
+
+    def record(self, label, seconds, error=None):
+        with self.lock:
+            self.latencies[label].append(seconds)
+            if error:
+                self.errors[label] += 1
+                self.messages[f"{label}: {error}"] += 1
+
+
+# Helper function to get the outputs of a callback from its dependency, e.g. "route-map.figure"
+# or "..a.children...b.style.." for several outputs
+def callback_outputs(output):
+    def parse(spec):
+        component_id, prop = spec.rsplit(".", 1)
+        return {"id": component_id, "property": prop}
+
+    if output.startswith(".."):
+        return [parse(spec) for spec in output[2:-2].split("...")]
+    return parse(output)
+
+
+# Helper function to collect the props of the components of a layout with an id, keyed by "id.property"
+def component_props(layout, props=None):
+    props = {} if props is None else props
+    if isinstance(layout, list):
+        for item in layout:
+            component_props(item, props)
+    elif isinstance(layout, dict):
+        if "props" in layout and "type" in layout:
+            component_id = layout["props"].get("id")
+            if isinstance(component_id, str):
+                props.update((f"{component_id}.{prop}", value) for prop, value in layout["props"].items())
+            layout = layout["props"]
+        for value in layout.values():
+            component_props(value, props)
+    return props
+
+
+class Session:
+    """One simulated user: opens the app, navigates between its pages and changes the Graphs filters.
+
+    The callbacks fired by a change are the ones whose inputs changed, as in the browser, called
+    one after the other with the values of the user's own components.
+    """
+
+    def __init__(self, client, callbacks, stats, rng, actions, think_time):
+        self.client, self.callbacks, self.stats, self.rng = client, callbacks, stats, rng
+        self.actions, self.think_time = actions, think_time
+        self.state = {}
+
+    def options(self, component_id):
+        return [option["value"] for option in self.state.get(f"{component_id}.options") or []]
+
+    def call(self, callback, changed):
+        key = lambda dependency: f"{dependency['id']}.{dependency['property']}"
+        body = {
+            "output": callback["output"],
+            "outputs": callback_outputs(callback["output"]),
+            "inputs": [dict(dependency, value=self.state.get(key(dependency))) for dependency in callback["inputs"]],
+            "changedPropIds": changed,
+            "state": [dict(dependency, value=self.state.get(key(dependency))) for dependency in callback["state"]],
+        }
+        # Pages are told apart, each one is built by its own code
+        label = callback["output"]
+        if "url.pathname" in map(key, callback["inputs"]):
+            label += f" {self.state.get('url.pathname')}"
+
+        start = time.perf_counter()
+        try:
+            status, data = self.client.request("POST", "/_dash-update-component", body)
+            # A background callback answers with its job, polled like the browser does until it is done,
+            # so its latency is the time the user waits for the result
+            result = json.loads(data) if status == 200 else {}
+            if callback.get("long") and "cacheKey" in result:
+                path = f"/_dash-update-component?cacheKey={result['cacheKey']}&job={result['job']}"
+                while status == 200 and "response" not in result:
+                    time.sleep(callback["long"]["interval"] / 1000)
+                    status, data = self.client.request("POST", path, body)
+                    result = json.loads(data) if status == 200 else {}
+        except (OSError, http.client.HTTPException) as error:
+            self.stats.record(label, time.perf_counter() - start, type(error).__name__)
+            return []
+        self.stats.record(label, time.perf_counter() - start, None if status in (200, 204) else f"HTTP {status}")
+        if status != 200:
+            return []
+
+        # The returned props replace the user's, new components bring their own
+        updated = []
+        for component_id, props in result["response"].items():
+            for prop, value in props.items():
+                self.state[f"{component_id}.{prop}"] = value
+                updated.append(f"{component_id}.{prop}")
+                if prop == "children":
+                    self.render(component_props(value))
+        return updated
+
+    # Fire the callbacks of some changed props, then those of the props they changed
+    def fire(self, changed):
+        for callback in self.callbacks:
+            if any(f"{dependency['id']}.{dependency['property']}" in changed for dependency in callback["inputs"]):
+                updated = self.call(callback, changed)
+                if updated:
+                    self.fire(updated)
+
+    # Replace the props of newly rendered components and fire their initial callbacks
+    def render(self, props):
+        component_ids = {key.rsplit(".", 1)[0] for key in props}
+        self.state = {key: value for key, value in self.state.items() if key.rsplit(".", 1)[0] not in component_ids}
+        self.state.update(props)
+        for callback in self.callbacks:
+            if not callback["prevent_initial_call"] and all(
+                dependency["id"] in component_ids for dependency in callback["inputs"]
+            ):
+                self.call(callback, [])
+
+    def page(self):
+        return self.rng.choices(list(PAGES), weights=PAGES.values())[0]
+
+    def navigate(self):
+        self.state["url.pathname"] = self.page()
+        self.fire(["url.pathname"])
+
+    def select(self, component_id, values):
+        self.state[f"{component_id}.value"] = self.rng.sample(values, self.rng.randint(0, min(len(values), MAX_SELECTED[component_id])))
+        self.fire([f"{component_id}.value"])
+
+    def graphs_action(self):
+        action = self.rng.choices(list(GRAPHS_ACTIONS), weights=GRAPHS_ACTIONS.values())[0]
+        if action == "years":
+            self.select("year-dropdown", self.options("year-dropdown"))
+        elif action == "source-cities":
+            self.select("source-city-dropdown", self.options("source-city-dropdown"))
+        elif action == "destination-cities":
+            self.select("destination-city-dropdown", self.options("destination-city-dropdown"))
+        elif action == "routes":
+            # Type the start of a city name in the route search, then pick some of the routes found
+            cities = self.options("source-city-dropdown")
+            if cities:
+                self.state["route-dropdown.search_value"] = str(self.rng.choice(cities))[:3]
+                self.fire(["route-dropdown.search_value"])
+                self.select("route-dropdown", self.options("route-dropdown"))
+        elif action == "direction":
+            self.state["source-dest-btn.on"] = not self.state.get("source-dest-btn.on")
+            self.fire(["source-dest-btn.on"])
+        elif action == "sankey":
+            self.state["sankey-selector.value"] = self.rng.choice(self.options("sankey-selector"))
+            self.fire(["sankey-selector.value"])
+        else:
+            self.navigate()
+
+    def think(self):
+        if self.think_time:
+            time.sleep(self.rng.expovariate(1 / self.think_time))
+
+    # Open the app like a browser, then take some actions on the page it lands on
+    def run(self):
+        self.state = {}
+        start = time.perf_counter()
+        status, data = self.client.request("GET", "/_dash-layout")
+        self.stats.record("GET /_dash-layout", time.perf_counter() - start, None if status == 200 else f"HTTP {status}")
+        # The app opens on some page, whose pathname dcc.Location gives to the initial callbacks
+        props = component_props(json.loads(data))
+        props["url.pathname"] = self.page()
+        self.render(props)
+        for _ in range(self.actions):
+            self.think()
+            if self.state.get("url.pathname") == "/graphs":
+                self.graphs_action()
+            else:
+                self.navigate()
+
+
+# Helper function to run one user's sessions until the end of the test
+def run_user(url, callbacks, stats, seed, args, deadline):
+    client = DashClient(url, args.timeout)
+    session = Session(client, callbacks, stats, random.Random(seed), args.actions, args.think_time)
+    try:
+        while time.monotonic() < deadline:
+            try:
+                session.run()
+            except (OSError, http.client.HTTPException, ValueError) as error:
+                stats.record("session", 0.0, type(error).__name__)
+                client.close()
+    finally:
+        client.close()
+
+
+# Helper function to find a free local port for the server
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Start the app under gunicorn with the production settings and wait until it answers
+@contextmanager
+def start_server(env, startup_timeout, log_path=None):
+    port = free_port()
+    if log_path:
+        log = open(log_path, "w")
+    else:
+        log = tempfile.NamedTemporaryFile(prefix="load-test-", suffix=".log", delete=False)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:server", "--config", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            if process.poll() is not None:
+                raise SystemExit(f"The server exited with code {process.returncode}, see {log.name}")
+            if time.monotonic() > deadline:
+                raise SystemExit(f"The server did not start within {startup_timeout} seconds, see {log.name}")
+            # The server is ready once the warmup of its workers is done, as a load balancer sees it
+            try:
+                if DashClient(url, 5).request("GET", "/ready")[0] == 200:
+                    break
+            except OSError:
+                pass
+            time.sleep(0.5)
+    except BaseException:
+        process.kill()
+        log.close()
+        raise
+    # A temporary log is only kept when the server failed to start
+    try:
+        yield url
+    finally:
+        process.terminate()
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+        if not log_path:
+            os.unlink(log.name)
+
+
+# Helper function to summarize the recorded requests per callback, with a total
+def summarize(stats, elapsed):
+    rows = {}
+    labels = sorted(stats.latencies) + ["total"]
+    for label in labels:
+        if label == "total":
+            latencies = np.concatenate([np.asarray(values) for values in stats.latencies.values()] or [np.empty(0)])
+            errors = sum(stats.errors.values())
+        else:
+            latencies, errors = np.asarray(stats.latencies[label]), stats.errors[label]
+        if not len(latencies):
+            continue
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        rows[label] = {
+            "requests": len(latencies), "errors": errors, "error_rate": errors / len(latencies),
+            "throughput": len(latencies) / elapsed,
+            "p50": p50, "p95": p95, "p99": p99, "max": latencies.max(),
+        }
+    return rows
+
+
+# Helper function to print the summary as a table
+def print_summary(summary, stats, elapsed):
+    table = [
+        [label, row["requests"], row["errors"], row["error_rate"] * 100, row["throughput"],
+         row["p50"] * 1000, row["p95"] * 1000, row["p99"] * 1000, row["max"] * 1000]
+        for label, row in summary.items()
+    ]
+    headers = ["callback", "requests", "errors", "error %", "req/s", "p50 ms", "p95 ms", "p99 ms", "max ms"]
+    print(tabulate(table, headers=headers, floatfmt=".1f", tablefmt="grid"))
+    print(f"{elapsed:.1f} seconds")
+    for message, count in sorted(stats.messages.items()):
+        print(f"  {count} x {message}")
+
+
+def run_load_test(url, args):
+    status, data = DashClient(url, args.timeout).request("GET", "/_dash-dependencies")
+    if status != 200:
+        raise SystemExit(f"{url}/_dash-dependencies returned HTTP {status}")
+    # Clientside callbacks run in the browser and never reach the server
+    callbacks = [callback for callback in json.loads(data) if not callback.get("clientside_function")]
+
+    stats = Stats()
+    start = time.monotonic()
+    deadline = start + args.duration
+    users = [
+        threading.Thread(target=run_user, args=(url, callbacks, stats, args.seed * 100003 + user, args, deadline))
+        for user in range(args.users)
+    ]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.monotonic() - start
+
+    summary = summarize(stats, elapsed)
+    print_summary(summary, stats, elapsed)
+    status, data = DashClient(url, args.timeout).request("GET", "/cache-stats")
+    cache_stats = json.loads(data) if status == 200 else None
+
+    if args.output:
+        report = {
+            "users": args.users, "duration": elapsed, "actions": args.actions, "think_time": args.think_time,
+            "workers": args.workers, "threads": args.threads, "rows": args.rows, "seed": args.seed,
+            "callbacks": summary, "errors": dict(stats.messages), "cache_stats": cache_stats,
+        }
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load-test the dashboard with simulated users driving its Dash callbacks, offline under gunicorn."
+    )
+    parser.add_argument("--users", type=int, default=10, help="Concurrent simulated users (default: 10)")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run the test for (default: 60)")
+    parser.add_argument("--actions", type=int, default=8, help="Actions of a session before it reopens the app (default: 8)")
+    parser.add_argument("--think-time", type=float, default=0,
+                        help="Mean seconds a user waits between actions, 0 sends the next one at once (default: 0)")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds before a request fails (default: 120)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the sessions and of the synthetic data (default: 0)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--url", help="Test a server already running at this URL instead of starting one")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes (default: 2)")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker (default: 4)")
+    parser.add_argument("--rows", type=int, help="Serve synthetic data with this many rows instead of datasets/")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR,
+                        help="Directory where the synthetic data is generated and reused (default: %(default)s)")
+    parser.add_argument("--cache-dir", help="Figure cache directory of the server (default: a new, empty one)")
+    parser.add_argument("--server-log", help="Write the output of the server, with the tracebacks of failed callbacks, to this file")
+    parser.add_argument("--startup-timeout", type=float, default=300,
+                        help="Seconds to wait for the server to start (default: 300)")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        run_load_test(args.url.rstrip("/"), args)
+        return
+
+    env = dict(os.environ, WEB_CONCURRENCY=str(args.workers), GUNICORN_THREADS=str(args.threads))
+    if args.rows:
+        directory = data_directory(args.data_dir, args.rows, args.seed)
+        if not is_generated(directory):
+            generate(args.rows, directory, args.seed)
+        env.update(data_environment(directory))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env["FIGURE_CACHE_DIR"] = args.cache_dir or cache_dir
+        with start_server(env, args.startup_timeout, args.server_log) as url:
+            run_load_test(url, args)
+
+
+if __name__ == "__main__":
+    main()
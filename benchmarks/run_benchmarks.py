@@ -0,0 +1,258 @@
+import argparse
+import importlib.metadata
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from plotly.io.json import to_json_plotly
+from tabulate import tabulate
+
+from synthetic_data import DEFAULT_DATA_DIR, data_directory, data_environment, generate, is_generated
+
+# Dataset sizes run by default, 10 million rows is opt-in with --sizes
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+# Packages whose versions are recorded with the results
+PACKAGES = ["dash", "plotly", "pandas", "numpy", "pyarrow"]
+
+# Stages faster than this in both runs are not compared
+MIN_COMPARED_SECONDS = 0.001
+
+# Pages of the app built from the star schema, timed cold by display_page
+PAGES = ["/data-summary", "/top-10", "/trend-analysis"]
+
+
+# Helper function to time some calls of a function: minimum and median seconds, and the
+# peak memory allocated by one more call under tracemalloc, which would slow down the timed calls
+def measure(function, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"min": min(seconds), "median": statistics.median(seconds), "peak_bytes": peak}
+
+
+# Helper function to get the selections of the Graphs page to time: everything, the latest year,
+# and the latest year from its three busiest source cities
+def graphs_selections(df_graphs):
+    year = int(df_graphs["Year"].max())
+    cities = df_graphs.loc[df_graphs["Year"] == year, "city1"].value_counts().index[:3].tolist()
+    return {
+        "all": ([], [], []),
+        "year": ([year], [], []),
+        "year+cities": ([year], cities, []),
+    }
+
+
+# Helper function to run the stages of the Graphs page for one selection: filter, aggregate, figures and JSON
+def benchmark_graphs(app, selection, repeat):
+    year_selected, source_city_selected, destination_city_selected = selection
+    key = tuple(map(app.normalize_selection, selection))
+    selections = dict(zip(app.FILTER_COLUMNS, key))
+
+    # The figure callbacks are timed without their disk cache, on the view of the selection
+    figures = {
+        "route-map": lambda: app.update_route_map.__wrapped__(*selection),
+        "box-plot": lambda: app.update_box_plot.__wrapped__(*selection, None),
+        "sankey": lambda: app.update_sankey.__wrapped__(*selection),
+    }
+    app.get_filtered_view(year_selected, source_city_selected, destination_city_selected)
+    outputs = [build() for build in figures.values()]
+
+    stages = {
+        "filter": lambda: app.filter_positions(selections),
+        "aggregate": lambda: app.compute_filtered_view.__wrapped__(*key),
+    }
+    stages.update({f"figure:{name}": build for name, build in figures.items()})
+    stages["serialize"] = lambda: [to_json_plotly(figure) for figure in outputs]
+    return {stage: measure(function, repeat) for stage, function in stages.items()}
+
+
+# Helper function to run the stages of the pages built from the star schema: load, aggregate, figures and JSON
+def benchmark_summary(app, repeat):
+    star = app.load_star_schema()
+    figures = app.generate_top_10_figures(star) + app.create_trend_figures(star)
+    results = {
+        "load": measure(app.load_star_schema.__wrapped__, repeat),
+        "aggregate": measure(app.compute_unique_counts.__wrapped__, repeat),
+        "figure:top-10": measure(lambda: app.generate_top_10_figures(star), repeat),
+        "figure:trend": measure(lambda: app.create_trend_figures(star), repeat),
+        "serialize": measure(lambda: [to_json_plotly(figure) for figure in figures], repeat),
+    }
+
+    # A cold page loads the star schema and builds its layout again
+    def render_page(pathname):
+        app.load_star_schema.cache_clear()
+        for layout in (app.get_data_summary_layout, app.get_top_10_layout, app.get_trend_layout):
+            layout.cache_clear()
+        return to_json_plotly(app.display_page(pathname))
+
+    for pathname in PAGES:
+        results[f"page:{pathname}"] = measure(lambda: render_page(pathname), repeat)
+    return results
+
+
+# Helper function to run every benchmark of one dataset size, in the process started by run_size
+def run_single(repeat):
+    start = time.perf_counter()
+    sys.path.insert(0, '..')
+    import app
+    import_seconds = time.perf_counter() - start
+
+    results = [{"group": "setup", "case": "-", "stage": "import", "min": import_seconds, "median": import_seconds}]
+    for case, selection in graphs_selections(app.df_graphs).items():
+        for stage, result in benchmark_graphs(app, selection, repeat).items():
+            results.append({"group": "graphs", "case": case, "stage": stage, **result})
+    for stage, result in benchmark_summary(app, repeat).items():
+        results.append({"group": "summary", "case": "-", "stage": stage, **result})
+
+    # Linux reports the maximum resident set size in kilobytes
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {"rows": len(app.df_graphs), "max_rss_bytes": max_rss, "results": results}
+
+
+# Helper function to generate the data of one size if needed and benchmark it in a fresh process,
+# so that every size starts from an empty heap and the app loads its own data
+def run_size(rows, seed, repeat, data_dir):
+    directory = data_directory(data_dir, rows, seed)
+    generate_seconds = None
+    if not is_generated(directory):
+        start = time.perf_counter()
+        generate(rows, directory, seed)
+        generate_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(
+            os.environ,
+            **data_environment(directory),
+            FIGURE_CACHE_DIR=cache_dir,
+            # Nothing is kept in the figure cache, every page is built again
+            FIGURE_CACHE_MAX_BYTES="0",
+        )
+        env.pop("DATASET_YEARS", None)
+        output_path = os.path.join(cache_dir, "results.json")
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--single", output_path, "--repeat", str(repeat)],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env, check=True,
+        )
+        with open(output_path) as file:
+            result = json.load(file)
+
+    if generate_seconds is not None:
+        result["results"].insert(0, {
+            "group": "setup", "case": "-", "stage": "generate", "min": generate_seconds, "median": generate_seconds,
+        })
+    return result
+
+
+# Helper function to get the commit of the working tree, marked dirty when it has local changes
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty.stdout.strip() else "")
+
+
+# Helper function to flatten the results into one row per size, group, case and stage
+def result_rows(report):
+    return {
+        (size["rows"], result["group"], result["case"], result["stage"]): result
+        for size in report["sizes"]
+        for result in size["results"]
+    }
+
+
+# Helper function to print the results as a table, next to a baseline when given
+def print_report(report, baseline=None, tolerance=0.1):
+    baseline_rows = result_rows(baseline) if baseline else {}
+    table, regressions = [], []
+    for key, result in result_rows(report).items():
+        row = list(key) + [result["median"] * 1000, result["min"] * 1000]
+        row.append(result["peak_bytes"] / 1e6 if "peak_bytes" in result else None)
+        if baseline:
+            before = baseline_rows.get(key)
+            # The fastest calls are compared, they vary the least between runs
+            ratio = result["min"] / before["min"] if before and before["min"] else None
+            row += [before["min"] * 1000 if before else None, ratio]
+            # Setup stages depend on the state of the data directory and the fastest stages on timer noise
+            compared = key[1] != "setup" and max(result["min"], before["min"] if before else 0) >= MIN_COMPARED_SECONDS
+            if compared and ratio is not None and ratio > 1 + tolerance:
+                regressions.append(key)
+        table.append(row)
+
+    headers = ["rows", "group", "case", "stage", "median ms", "min ms", "peak MB"]
+    if baseline:
+        headers += ["baseline min ms", "ratio"]
+    print(tabulate(table, headers=headers, floatfmt=".2f", tablefmt="grid"))
+    for size in report["sizes"]:
+        print(f"{size['rows']} rows: max RSS {size['max_rss_bytes'] / 1e6:.1f} MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the data and figure paths of the dashboard on synthetic data.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Numbers of rows to benchmark (default: 10000 100000 1000000)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed calls of every stage (default: 3)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic data (default: 0)")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR,
+                        help="Directory where the synthetic data is generated and reused (default: %(default)s)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Slowdown of the fastest call beyond which a stage is reported as a regression (default: 0.1)")
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    # Benchmark process of one size, started by run_size with the data paths in its environment
+    if args.single:
+        with open(args.single, "w") as file:
+            json.dump(run_single(args.repeat), file)
+        return
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "versions": {package: importlib.metadata.version(package) for package in PACKAGES},
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "sizes": [run_size(rows, args.seed, args.repeat, args.data_dir) for rows in args.sizes],
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    regressions = print_report(report, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} stage(s) slower than the baseline by more than {args.tolerance:.0%}:")
+        for key in regressions:
+            print("  " + " / ".join(map(str, key)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+from load_test import DashClient, callback_outputs, component_props, start_server
+from synthetic_data import DEFAULT_DATA_DIR, data_directory, data_environment, generate, is_generated
+
+# Callback checked on every worker: the route map of the Graphs page, computed once and shared
+CALLBACK_OUTPUT = "route-map-store.data"
+
+
+class CheckFailed(Exception):
+    pass
+
+
+# Helper function to fail the check with a message unless a condition holds
+def check(condition, message):
+    if not condition:
+        raise CheckFailed(message)
+
+
+# Helper function to poll a function until its result satisfies a condition or a timeout passes,
+# returning the last result. The workers write what they buffer every few seconds
+def wait_for(function, condition, timeout):
+    deadline = time.monotonic() + timeout
+    result = function()
+    while not condition(result) and time.monotonic() < deadline:
+        time.sleep(0.5)
+        result = function()
+    return result
+
+
+# Helper function to poll a function until its result stays the same for some seconds, e.g. until
+# the workers wrote the counters they buffered during their warmup
+def settled(function, quiet, timeout):
+    deadline = time.monotonic() + timeout
+    result, since = function(), time.monotonic()
+    while time.monotonic() - since < quiet and time.monotonic() < deadline:
+        time.sleep(0.5)
+        latest = function()
+        if latest != result:
+            result, since = latest, time.monotonic()
+    return result
+
+
+# Helper function to GET a JSON route of the server
+def get_json(client, path):
+    status, data = client.request("GET", path)
+    return status, json.loads(data)
+
+
+# Helper function to call a Dash callback with the values of its inputs, keyed by "id.property"
+def call(client, callback, values):
+    body = {
+        "output": callback["output"],
+        "outputs": callback_outputs(callback["output"]),
+        "inputs": [
+            dict(dependency, value=values.get(f"{dependency['id']}.{dependency['property']}"))
+            for dependency in callback["inputs"]
+        ],
+        "changedPropIds": list(values),
+        "state": [],
+    }
+    status, data = client.request("POST", "/_dash-update-component", body)
+    return status, json.loads(data) if status == 200 else None
+
+
+# Helper function to get the years offered on the Graphs page, as the browser renders it
+def graphs_years(client, callbacks):
+    page = next(callback for callback in callbacks if callback["output"] == "page-content.children")
+    status, result = call(client, page, {"url.pathname": "/graphs"})
+    check(status == 200, f"the Graphs page answered HTTP {status}")
+    props = component_props(result["response"]["page-content"]["children"])
+    return [option["value"] for option in props["year-dropdown.options"]]
+
+
+# Helper function to open connections until every worker answered /ready. A kept-alive connection
+# stays on the worker that accepted it, so each client returned talks to one worker only
+def worker_clients(url, workers, timeout, attempts):
+    clients = {}
+    for _ in range(attempts):
+        client = DashClient(url, timeout)
+        status, ready = get_json(client, "/ready")
+        check(status == 200 and ready["ready"], f"worker {ready.get('pid')} is not ready: {ready}")
+        check(not ready["failed"], f"the warmup of worker {ready['pid']} failed: {ready['failed']}")
+        check(ready["done"] == ready["total"], f"the warmup of worker {ready['pid']} is not done: {ready}")
+        if ready["pid"] in clients:
+            client.close()
+        else:
+            clients[ready["pid"]] = client
+        if len(clients) == workers:
+            return clients
+    raise CheckFailed(f"only workers {sorted(clients)} answered in {attempts} connections, {workers} expected")
+
+
+# Helper function to call a callback on one worker. gunicorn closes idle kept-alive connections, the
+# client then reconnects to any worker, so the pid is checked right before and after the call
+def call_on_worker(url, pid, callback, values, timeout, attempts):
+    for _ in range(attempts):
+        client = DashClient(url, timeout)
+        try:
+            if get_json(client, "/ready")[1]["pid"] != pid:
+                continue
+            status, result = call(client, callback, values)
+            if get_json(client, "/ready")[1]["pid"] == pid:
+                return status, result
+        finally:
+            client.close()
+    raise CheckFailed(f"no connection reached worker {pid} in {attempts} attempts")
+
+
+# Helper function to read the value of a sample of the Prometheus text of /metrics
+def metric_value(text, sample):
+    match = re.search(rf"^{re.escape(sample)} (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def run_check(url, args):
+    client = DashClient(url, args.timeout)
+    clients = worker_clients(url, args.workers, args.timeout, args.attempts)
+    pids = sorted(clients)
+    print(f"/ready: workers {', '.join(map(str, pids))} are warm")
+
+    status, data = client.request("GET", "/_dash-dependencies")
+    check(status == 200, f"/_dash-dependencies answered HTTP {status}")
+    callbacks = json.loads(data)
+    callback = next(callback for callback in callbacks if callback["output"] == CALLBACK_OUTPUT)
+
+    # The most recent year alone is not one of the warmed selections, so the first worker computes it
+    years = graphs_years(client, callbacks)
+    values = {
+        "year-dropdown.value": [max(years)],
+        "source-city-dropdown.value": None,
+        "destination-city-dropdown.value": None,
+    }
+    sample = f'dash_callback_duration_seconds_count{{callback="{CALLBACK_OUTPUT}"}}'
+    # The counters of the warmup are written by every worker within its flush interval
+    calls_before, stats_before = settled(
+        lambda: (
+            metric_value(client.request("GET", "/metrics")[1].decode(), sample),
+            get_json(client, "/cache-stats")[1]["callbacks"].get("route-map", {"hits": 0, "misses": 0}),
+        ),
+        2 * args.flush_seconds + 1, args.flush_timeout,
+    )
+
+    figures = []
+    for pid in pids:
+        status, result = call_on_worker(url, pid, callback, values, args.timeout, args.attempts)
+        check(status == 200, f"{CALLBACK_OUTPUT} answered HTTP {status} on worker {pid}")
+        figure = result["response"]["route-map-store"]["data"]
+        check(figure.get("data"), f"{CALLBACK_OUTPUT} of worker {pid} has no traces")
+        figures.append(figure)
+        print(f"callback: {CALLBACK_OUTPUT} of year {max(years)} answered on worker {pid}")
+    check(all(figure == figures[0] for figure in figures), "the workers answered different figures")
+
+    # The figure is computed by the first worker only, the others read it from the shared SQLite cache
+    stats = wait_for(
+        lambda: get_json(client, "/cache-stats")[1]["callbacks"]["route-map"],
+        lambda stats: stats["hits"] - stats_before["hits"] >= len(pids) - 1,
+        args.flush_timeout,
+    )
+    misses, hits = stats["misses"] - stats_before["misses"], stats["hits"] - stats_before["hits"]
+    check(misses == 1 and hits == len(pids) - 1,
+          f"the figure cache is not shared by the workers: {misses} misses and {hits} hits")
+    print(f"/cache-stats: route-map computed once, {hits} hits from the other workers")
+
+    # Every worker adds its observations to the shared metrics store, any worker renders them all
+    calls = wait_for(
+        lambda: metric_value(client.request("GET", "/metrics")[1].decode(), sample) - calls_before,
+        lambda calls: calls >= len(pids),
+        args.flush_timeout,
+    )
+    check(calls == len(pids), f"/metrics counts {calls:g} calls of {CALLBACK_OUTPUT}, {len(pids)} expected")
+    print(f"/metrics: {calls:g} calls of {CALLBACK_OUTPUT} counted across the workers")
+
+    for worker_client in clients.values():
+        worker_client.close()
+    client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check that the preloaded app serves correctly under gunicorn with several workers."
+    )
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes (default: 2)")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker (default: 4)")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds before a request fails (default: 120)")
+    parser.add_argument("--attempts", type=int, default=100,
+                        help="Connections opened to reach every worker before failing (default: 100)")
+    parser.add_argument("--flush-seconds", type=float, default=5,
+                        help="Seconds between the writes of the counters the workers buffer (default: 5)")
+    parser.add_argument("--flush-timeout", type=float, default=30,
+                        help="Seconds to wait for the workers to write their cache counters and metrics (default: 30)")
+    parser.add_argument("--rows", type=int, help="Serve synthetic data with this many rows instead of datasets/")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic data (default: 0)")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR,
+                        help="Directory where the synthetic data is generated and reused (default: %(default)s)")
+    parser.add_argument("--server-log", help="Write the output of the server to this file")
+    parser.add_argument("--startup-timeout", type=float, default=300,
+                        help="Seconds to wait for the server to start (default: 300)")
+    args = parser.parse_args(argv)
+    if args.workers < 2:
+        parser.error("--workers must be at least 2 to check what the workers share")
+
+    env = dict(os.environ, WEB_CONCURRENCY=str(args.workers), GUNICORN_THREADS=str(args.threads))
+    env["FIGURE_CACHE_FLUSH_SECONDS"] = env["METRICS_FLUSH_SECONDS"] = str(args.flush_seconds)
+    # The route map is answered by its callback itself, not by a background job
+    env["BACKGROUND_MIN_ROWS"] = str(sys.maxsize)
+    if args.rows:
+        directory = data_directory(args.data_dir, args.rows, args.seed)
+        if not is_generated(directory):
+            generate(args.rows, directory, args.seed)
+        env.update(data_environment(directory))
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # A new, empty figure cache and metrics store, shared by the workers of this server only
+        env["FIGURE_CACHE_DIR"] = cache_dir
+        with start_server(env, args.startup_timeout, args.server_log) as url:
+            try:
+                run_check(url, args)
+            except CheckFailed as error:
+                raise SystemExit(f"FAILED: {error}")
+    print(f"OK in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
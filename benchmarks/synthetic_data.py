@@ -0,0 +1,229 @@
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Make the app's modules and the preprocessing scripts importable when running from the benchmarks directory
+sys.path.insert(0, '..')
+sys.path.insert(0, '../files')
+from datastore import write_dataset
+from preprocessing_code import output_schema
+from rollups import update_rollups
+
+# Size of the synthetic universe, close to the real data
+CITY_COUNT = 400
+ROUTE_COUNT = 20000
+CARRIERS = ['AA', 'AS', 'B6', 'DL', 'F9', 'G4', 'HA', 'NK', 'SY', 'UA', 'WN', 'XP', 'MX', 'QX', 'OO', 'YX']
+STATES = ['AL', 'AZ', 'CA', 'CO', 'FL', 'GA', 'IL', 'MA', 'MI', 'MN', 'NC', 'NV', 'NY', 'OH', 'OR', 'PA', 'TN', 'TX', 'UT', 'WA']
+YEARS = range(1993, 2025)
+
+# Output file names inside the data directory, like in datasets/
+DATASET_NAME = '_dataset'
+ROLLUPS_NAME = '_dataset_rollups'
+GRAPHS_NAME = '_dataset_graphs_serving.parquet'
+
+# Generated data is kept here between runs, one directory per size and seed
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'dashboard-benchmarks')
+
+
+# Helper function to build the cities, airports and routes the rows are drawn from
+def create_universe(rng):
+    cities = pd.DataFrame({
+        'City': [f"City {i:03d}, {STATES[i % len(STATES)]}" for i in range(CITY_COUNT)],
+        'Latitude': rng.uniform(25, 49, CITY_COUNT).astype(np.float32),
+        'Longitude': rng.uniform(-124, -67, CITY_COUNT).astype(np.float32),
+        'MarketId': 30000 + np.arange(CITY_COUNT),
+    })
+    cities['Coordinates'] = '(' + cities['Latitude'].round(6).astype(str) + ', ' + cities['Longitude'].round(6).astype(str) + ')'
+
+    # One to three airports per city
+    airport_city = np.repeat(np.arange(CITY_COUNT), rng.integers(1, 4, CITY_COUNT))
+    airports = pd.DataFrame({
+        'City': airport_city,
+        'Code': [f"{chr(65 + i // 676)}{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}" for i in range(len(airport_city))],
+        'Id': 10000 + np.arange(len(airport_city)),
+    })
+
+    # Routes between two airports of different cities, each with its usual carriers
+    origin = rng.integers(0, len(airports), ROUTE_COUNT)
+    destination = rng.integers(0, len(airports), ROUTE_COUNT)
+    keep = airports['City'].to_numpy()[origin] != airports['City'].to_numpy()[destination]
+    routes = pd.DataFrame({'OriginAirport': origin[keep], 'DestinationAirport': destination[keep]})
+    routes = routes.drop_duplicates(ignore_index=True)
+    routes['OriginCity'] = airports['City'].to_numpy()[routes['OriginAirport']]
+    routes['DestinationCity'] = airports['City'].to_numpy()[routes['DestinationAirport']]
+
+    # Great-circle distance between the two cities, in miles
+    lat1, lon1, lat2, lon2 = (
+        np.radians(cities[column].to_numpy(np.float64)[routes[side]])
+        for side, column in [('OriginCity', 'Latitude'), ('OriginCity', 'Longitude'),
+                             ('DestinationCity', 'Latitude'), ('DestinationCity', 'Longitude')]
+    )
+    haversine = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    routes['Distance'] = np.maximum(50, 3959 * 2 * np.arcsin(np.sqrt(haversine))).astype(np.int64)
+    routes['LargestCarrier'] = rng.integers(0, len(CARRIERS), len(routes))
+    routes['LowestFareCarrier'] = rng.integers(0, len(CARRIERS), len(routes))
+
+    # A few routes carry most of the traffic
+    weights = 1 / (np.arange(len(routes)) + 10.0) ** 1.1
+    routes['Weight'] = rng.permutation(weights / weights.sum())
+    return cities, airports, routes
+
+
+# Helper function to draw the rows: route, period and measures of each row
+def create_rows(rows, rng, routes):
+    route = rng.choice(len(routes), size=rows, p=routes['Weight'].to_numpy())
+    distance = routes['Distance'].to_numpy()[route]
+
+    # Mostly the usual carriers of the route, sometimes another one
+    def carriers(column):
+        usual = routes[column].to_numpy()[route]
+        other = rng.integers(0, len(CARRIERS), rows)
+        return np.where(rng.random(rows) < 0.9, usual, other)
+
+    fare = (50 + 0.12 * distance) * rng.lognormal(0, 0.25, rows)
+    return pd.DataFrame({
+        'Route': route,
+        'Year': rng.integers(YEARS.start, YEARS.stop, rows),
+        'Quarter': rng.integers(1, 5, rows),
+        'Passengers': np.minimum(rng.lognormal(5, 1.3, rows), 60000).astype(np.int64),
+        'Fare': fare.round(2),
+        'LargestCarrier': carriers('LargestCarrier'),
+        'LargestShare': rng.uniform(0.2, 1, rows),
+        'LargestFare': (fare * rng.uniform(0.9, 1.2, rows)).round(2),
+        'LowestFareCarrier': carriers('LowestFareCarrier'),
+        'LowestShare': rng.uniform(0.01, 1, rows),
+        'LowestFare': (fare * rng.uniform(0.6, 1.0, rows)).round(2),
+    })
+
+
+# Helper function to build a dictionary-encoded column from codes and their labels
+def dictionary(codes, labels):
+    return pa.DictionaryArray.from_arrays(pa.array(codes, pa.int32()), pa.array(labels, pa.string()))
+
+
+# Helper function to turn the drawn rows into record batches of the preprocessed dataset, one per year
+def dataset_batches(sample, cities, airports, routes):
+    route_labels = (
+        airports['Code'].to_numpy()[routes['OriginAirport']] + '-' + airports['Code'].to_numpy()[routes['DestinationAirport']]
+    )
+    for year, rows in sample.groupby('Year'):
+        route = rows['Route'].to_numpy()
+        origin_city, destination_city = (routes[column].to_numpy()[route] for column in ('OriginCity', 'DestinationCity'))
+        origin_airport, destination_airport = (
+            routes[column].to_numpy()[route] for column in ('OriginAirport', 'DestinationAirport')
+        )
+        columns = {
+            'Year': pa.array(rows['Year']),
+            'Quarter': pa.array(rows['Quarter']),
+            'OriginCityMarketId': pa.array(cities['MarketId'].to_numpy()[origin_city]),
+            'DestinationCityMarketId': pa.array(cities['MarketId'].to_numpy()[destination_city]),
+            'OriginCity': dictionary(origin_city, cities['City']),
+            'DestinationCity': dictionary(destination_city, cities['City']),
+            'OriginAirportId': pa.array(airports['Id'].to_numpy()[origin_airport]),
+            'DestinationAirportId': pa.array(airports['Id'].to_numpy()[destination_airport]),
+            'OriginAirportCode': dictionary(origin_airport, airports['Code']),
+            'DestinationAirportCode': dictionary(destination_airport, airports['Code']),
+            'RouteDistanceInMiles': pa.array(routes['Distance'].to_numpy()[route]),
+            'PassengerCount': pa.array(rows['Passengers']),
+            'AverageFare': pa.array(rows['Fare']),
+            'LargestCarrierCode': dictionary(rows['LargestCarrier'], CARRIERS),
+            'LargestCarrierMarketShare': pa.array(rows['LargestShare']),
+            'LargestCarrierAverageFare': pa.array(rows['LargestFare']),
+            'LowestFareCarrierCode': dictionary(rows['LowestFareCarrier'], CARRIERS),
+            'LowestFareMarketShare': pa.array(rows['LowestShare']),
+            'LowestFare': pa.array(rows['LowestFare']),
+            'OriginCityCoordinates': dictionary(origin_city, cities['Coordinates']),
+            'DestinationCityCoordinates': dictionary(destination_city, cities['Coordinates']),
+            'Route': dictionary(route, route_labels),
+        }
+        # Cast one year at a time, so only that year's strings are ever materialized
+        table = pa.table(columns).cast(output_schema)
+        yield from table.to_batches()
+
+
+# Helper function to build the serving-ready Graphs dataset of the drawn rows, as built by build_graphs_dataset.py
+def graphs_frame(sample, cities, airports, routes):
+    route = sample['Route'].to_numpy()
+    origin_city, destination_city = (routes[column].to_numpy()[route] for column in ('OriginCity', 'DestinationCity'))
+    origin_airport, destination_airport = (
+        routes[column].to_numpy()[route] for column in ('OriginAirport', 'DestinationAirport')
+    )
+    # Routes of the Graphs dataset are city pairs, several airport routes can share one
+    route_codes, route_labels = pd.factorize(
+        cities['City'].to_numpy()[routes['OriginCity']] + ' - ' + cities['City'].to_numpy()[routes['DestinationCity']]
+    )
+    return pd.DataFrame({
+        'Year': sample['Year'].astype(np.int16),
+        'quarter': sample['Quarter'].astype(np.int8),
+        'city1': pd.Categorical.from_codes(origin_city, cities['City']),
+        'city2': pd.Categorical.from_codes(destination_city, cities['City']),
+        'airport_1': pd.Categorical.from_codes(origin_airport, airports['Code']),
+        'airport_2': pd.Categorical.from_codes(destination_airport, airports['Code']),
+        'nsmiles': routes['Distance'].to_numpy()[route].astype(np.int32),
+        'passengers': sample['Passengers'].astype(np.int32),
+        'fare': sample['Fare'],
+        'carrier_lg': pd.Categorical.from_codes(sample['LargestCarrier'], CARRIERS),
+        'large_ms': sample['LargestShare'],
+        'fare_lg': sample['LargestFare'],
+        'carrier_low': pd.Categorical.from_codes(sample['LowestFareCarrier'], CARRIERS),
+        'lf_ms': sample['LowestShare'],
+        'fare_low': sample['LowestFare'],
+        'start_lat': cities['Latitude'].to_numpy()[origin_city],
+        'start_lon': cities['Longitude'].to_numpy()[origin_city],
+        'end_lat': cities['Latitude'].to_numpy()[destination_city],
+        'end_lon': cities['Longitude'].to_numpy()[destination_city],
+        'route': pd.Categorical.from_codes(route_codes[route], route_labels),
+    })
+
+
+# Generate the preprocessed dataset, its rollups and the Graphs dataset with some number of rows.
+# The same rows and seed always give the same data
+def generate(rows, directory, seed=0):
+    rng = np.random.default_rng(seed)
+    cities, airports, routes = create_universe(rng)
+    sample = create_rows(rows, rng, routes)
+
+    os.makedirs(directory, exist_ok=True)
+    dataset_path = os.path.join(directory, DATASET_NAME)
+    write_dataset(dataset_batches(sample, cities, airports, routes), dataset_path, schema=output_schema)
+    graphs_frame(sample, cities, airports, routes).to_parquet(os.path.join(directory, GRAPHS_NAME), index=False)
+    update_rollups(dataset_path, os.path.join(directory, ROLLUPS_NAME))
+
+
+# Helper function to get the directory of the data generated with some number of rows and seed
+def data_directory(data_dir, rows, seed):
+    return os.path.join(data_dir, f"{rows}-seed{seed}")
+
+
+# Helper function to check whether all the data of a directory was generated
+def is_generated(directory):
+    return all(os.path.exists(os.path.join(directory, name)) for name in (DATASET_NAME, ROLLUPS_NAME, GRAPHS_NAME))
+
+
+# Helper function to get the environment variables pointing the app at the data of a directory
+def data_environment(directory):
+    return {
+        'DATASET_PATH': os.path.join(directory, DATASET_NAME),
+        'ROLLUPS_PATH': os.path.join(directory, ROLLUPS_NAME),
+        'GRAPHS_DATASET_PATH': os.path.join(directory, GRAPHS_NAME),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate deterministic synthetic datasets with the schemas of the app's data.")
+    parser.add_argument("rows", type=int, help="Number of rows of the dataset and of the Graphs dataset")
+    parser.add_argument("directory", help="Output directory")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args(argv)
+
+    generate(args.rows, args.directory, args.seed)
+    print(f"Wrote {args.rows} rows to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
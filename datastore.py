@@ -0,0 +1,109 @@
+import os
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+# Column the preprocessed dataset is partitioned by, one directory per value
+PARTITION_COLUMN = 'Year'
+
+
+# Helper function to parse a year selection such as "2015-2024" or "2019,2020,2023"
+def parse_years(text):
+    if not text:
+        return None
+    years = []
+    for part in text.split(','):
+        first, _, last = part.strip().partition('-')
+        years.extend(range(int(first), int(last or first) + 1))
+    return sorted(set(years))
+
+
+# Helper function to open the dataset, either the Year-partitioned directory or a single Parquet file
+def open_dataset(path):
+    if os.path.isdir(path):
+        return ds.dataset(path, format='parquet', partitioning='hive')
+    return ds.dataset(path, format='parquet')
+
+
+# Helper function to list the Year partitions of the dataset as year selections for read_dataset, in
+# the order the dataset reads them. A single Parquet file is read whole, as one partition
+def partition_years(path, years=None):
+    if not os.path.isdir(path):
+        return [years]
+    partitions = []
+    for fragment in open_dataset(path).get_fragments():
+        year = ds.get_partition_keys(fragment.partition_expression).get(PARTITION_COLUMN)
+        if year is None:
+            return [years]
+        if (not years or year in years) and [year] not in partitions:
+            partitions.append([year])
+    return partitions or [years]
+
+
+# Helper function to read only some columns and years, the filter prunes partitions and row groups
+def read_dataset(path, columns=None, years=None):
+    dataset = open_dataset(path)
+    if columns is not None:
+        columns = [column for column in columns if column in dataset.schema.names]
+    row_filter = ds.field(PARTITION_COLUMN).isin(years) if years else None
+    return dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+
+
+# Helper function to write a table or a stream of record batches as a Year-partitioned dataset,
+# by default replacing the partitions that are written to
+def write_dataset(data, path, schema=None, basename_template=None, existing_data_behavior='delete_matching'):
+    ds.write_dataset(
+        data,
+        path,
+        schema=schema,
+        format='parquet',
+        basename_template=basename_template,
+        partitioning=[PARTITION_COLUMN],
+        partitioning_flavor='hive',
+        # Buffer small streamed batches into row groups large enough for useful statistics
+        min_rows_per_group=64 * 1024,
+        existing_data_behavior=existing_data_behavior,
+    )
+
+
+# Helper function to write a table as one file of its Year partition. The file is written aside, with
+# a name the dataset ignores, and renamed into place, so a failure never leaves a partial file
+def write_partition_file(table, path, year, name):
+    partition = os.path.join(path, f"{PARTITION_COLUMN}={year}")
+    os.makedirs(partition, exist_ok=True)
+    if PARTITION_COLUMN in table.column_names:
+        table = table.drop_columns([PARTITION_COLUMN])
+    temporary_path = os.path.join(partition, f".{name}.{os.getpid()}.tmp")
+    pq.write_table(table, temporary_path, row_group_size=64 * 1024)
+    os.replace(temporary_path, os.path.join(partition, name))
+
+
+# Helper function to narrow the dictionary indices of a column to the type pandas uses for the category codes
+def narrow_dictionary(column):
+    column = column.unify_dictionaries().combine_chunks()
+    count = len(column.dictionary)
+    index_type = pa.int8() if count < 2 ** 7 else pa.int16() if count < 2 ** 15 else pa.int32()
+    return column.cast(pa.dictionary(index_type, column.type.value_type))
+
+
+# Helper function to read some columns and years of a Parquet file through an uncompressed,
+# memory-mapped Arrow copy of them. The columns of the frame point into the mapped file, so every
+# process reading it shares the same read-only pages instead of holding a private copy. The copy
+# only holds the selected columns and years, its path must identify them
+def read_mapped(path, arrow_path, columns=None, years=None):
+    if not os.path.exists(arrow_path):
+        row_filter = ds.field(PARTITION_COLUMN).isin(years) if years else None
+        table = pq.read_table(path, columns=columns, filters=row_filter)
+        columns = [narrow_dictionary(column) if pa.types.is_dictionary(column.type) else column for column in table.columns]
+        table = pa.table(columns, names=table.column_names).replace_schema_metadata(table.schema.metadata)
+        os.makedirs(os.path.dirname(arrow_path) or '.', exist_ok=True)
+        # Concurrent writers each write their own file, the rename publishes one of them whole
+        temporary_path = f"{arrow_path}.{os.getpid()}.tmp"
+        feather.write_feather(table, temporary_path, compression='uncompressed')
+        os.replace(temporary_path, arrow_path)
+
+    table = feather.read_table(arrow_path, memory_map=True)
+    # split_blocks keeps pandas from consolidating, i.e. copying, the columns into 2D blocks
+    return table.to_pandas(split_blocks=True)
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from functools import wraps
+
+from plotly.io.json import to_json_plotly
+
+from forksafe import PeriodicFlush, sqlite_guard
+from metrics import stage
+
+# Directory of the on-disk caches, shared by every worker process on the host
+CACHE_DIR = os.environ.get("FIGURE_CACHE_DIR", ".cache")
+
+# Upper bound of the cached figure JSON, least recently used entries are evicted beyond it
+CACHE_MAX_BYTES = int(os.environ.get("FIGURE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Seconds between the writes of the hit/miss counters and last use times buffered by each process
+CACHE_FLUSH_SECONDS = float(os.environ.get("FIGURE_CACHE_FLUSH_SECONDS", 5))
+
+
+# Helper function to fingerprint the files a cache depends on, directories included. Files are
+# identified by their path, size and modification time, so start-up does not read their content
+def file_fingerprint(*paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+            )
+        else:
+            files = [path]
+        for file_path in files:
+            stat = os.stat(file_path)
+            digest.update(f"{os.path.relpath(file_path, path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+# Helper function to make callback arguments order-insensitive, multi-select values are sets.
+# The values of the arguments at the ordered positions keep their order, only duplicates are dropped
+def normalize_args(args, ordered=()):
+    normalized = []
+    for position, value in enumerate(args):
+        if isinstance(value, (list, tuple)):
+            if position in ordered:
+                value = list(dict.fromkeys(value)) or None
+            else:
+                value = sorted(set(value), key=str) or None
+        normalized.append(value)
+    return normalized
+
+
+class FigureCache:
+    """Size-bounded LRU cache of figure JSON in a SQLite file.
+
+    SQLite handles the locking, so one file is safely shared by all gunicorn
+    workers. Entries written for another fingerprint are dropped on start-up.
+    A hit only reads the file: the hit/miss counters and last use times are
+    buffered by each process and written in one transaction every few seconds.
+    """
+
+    def __init__(self, name, fingerprint, max_bytes=CACHE_MAX_BYTES, cache_dir=CACHE_DIR,
+                 flush_seconds=CACHE_FLUSH_SECONDS):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, f"{name}.sqlite")
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        # Positions of the order-sensitive arguments of every memoized function, see memoize
+        self._ordered = {}
+        # Counters of this process not yet written: (name, "hits" or "misses") -> count, and
+        # the last use time of the entries hit since the last write
+        self._counts = Counter()
+        self._uses = {}
+        self._pending_pid = os.getpid()
+        self._pending_lock = threading.Lock()
+        self._flusher = PeriodicFlush(self.flush, flush_seconds)
+        # A child forked while another thread buffers a hit would never get the lock
+        os.register_at_fork(
+            before=self._pending_lock.acquire,
+            after_in_parent=self._pending_lock.release,
+            after_in_child=self._pending_lock.release,
+        )
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, fingerprint TEXT, value BLOB, size INTEGER, last_used REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stats ("
+                "name TEXT PRIMARY KEY, hits INTEGER DEFAULT 0, misses INTEGER DEFAULT 0)"
+            )
+            conn.execute("DELETE FROM entries WHERE fingerprint != ?", (fingerprint,))
+
+    def _connect(self):
+        # One connection per thread, reopened after a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _key(self, name, args):
+        payload = json.dumps([name, normalize_args(args, self._ordered.get(name, ()))], default=str)
+        return hashlib.sha256((self.fingerprint + payload).encode()).hexdigest()
+
+    def _count(self, name, column, key=None):
+        with self._pending_lock:
+            # Counters buffered before a fork belong to the parent process
+            if self._pending_pid != os.getpid():
+                self._counts.clear()
+                self._uses.clear()
+                self._pending_pid = os.getpid()
+            self._counts[name, column] += 1
+            if key is not None:
+                self._uses[key] = time.time()
+        self._flusher.start()
+
+    def _take_pending(self):
+        with self._pending_lock:
+            if self._pending_pid != os.getpid():
+                return Counter(), {}
+            counts, uses = self._counts, self._uses
+            self._counts, self._uses = Counter(), {}
+        return counts, uses
+
+    def _write_pending(self, conn, counts, uses):
+        conn.executemany(
+            "UPDATE entries SET last_used = MAX(last_used, ?) WHERE key = ?",
+            [(last_used, key) for key, last_used in uses.items()],
+        )
+        conn.executemany(
+            "INSERT INTO stats (name, hits, misses) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+            [
+                (name, counts[name, "hits"], counts[name, "misses"])
+                for name in {name for name, _ in counts}
+            ],
+        )
+
+    def flush(self):
+        """Write the counters and last use times buffered by this process, in one transaction."""
+        counts, uses = self._take_pending()
+        if not counts:
+            return
+        conn = self._connect()
+        try:
+            with sqlite_guard(), conn:
+                conn.execute("BEGIN IMMEDIATE")
+                self._write_pending(conn, counts, uses)
+        except sqlite3.Error:
+            # The counters are best effort, a busy or broken file never fails a request
+            pass
+
+    def get(self, name, args):
+        key = self._key(name, args)
+        with sqlite_guard():
+            row = self._connect().execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count(name, "misses")
+            return None
+        self._count(name, "hits", key)
+        return zlib.decompress(row[0]).decode()
+
+    def contains(self, name, args):
+        """Check for a cached entry without counting a hit or a miss."""
+        with sqlite_guard():
+            row = self._connect().execute("SELECT 1 FROM entries WHERE key = ?", (self._key(name, args),)).fetchone()
+        return row is not None
+
+    def set(self, name, args, value):
+        value = zlib.compress(value.encode(), 1)
+        conn = self._connect()
+        with sqlite_guard(), conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (self._key(name, args), self.fingerprint, value, len(value), time.time()),
+            )
+            # The write lock is held anyway, the buffered counters go along and the last use
+            # times are up to date before evicting
+            self._write_pending(conn, *self._take_pending())
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop the least recently used entries until the cache fits again
+        rows = conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall()
+        expired = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            expired.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", expired)
+
+    def stats(self):
+        """Size of the cache and hit/miss counters of every function. Those other workers buffered
+        since their last write are not counted yet."""
+        self.flush()
+        conn = self._connect()
+        with sqlite_guard():
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            counters = {
+                name: {"hits": hits, "misses": misses}
+                for name, hits, misses in conn.execute("SELECT name, hits, misses FROM stats")
+            }
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes, "callbacks": counters}
+
+    def memoize(self, name, ordered=()):
+        """Cache the JSON of a function returning figures under its normalized arguments.
+
+        Multi-select arguments are cached as sets, except those at the ordered positions, e.g.
+        a list of routes the figure draws in the order they were selected.
+        """
+        self._ordered[name] = frozenset(ordered)
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args):
+                try:
+                    cached = self.get(name, args)
+                except sqlite3.Error:
+                    cached = None
+                if cached is not None:
+                    return json.loads(cached)
+
+                figure = func(*args)
+                try:
+                    with stage("serialize"):
+                        value = to_json_plotly(figure)
+                    self.set(name, args, value)
+                except sqlite3.Error:
+                    pass
+                return figure
+
+            return wrapper
+
+        return decorator
@@ -0,0 +1,57 @@
+import base64
+
+import numpy as np
+
+from metrics import stage
+
+# Numeric arrays at least this long are sent as base64 typed arrays, shorter ones stay JSON lists
+MIN_TYPED_ARRAY_LENGTH = 8
+
+# Typed array types decoded by plotly.js, which has no 64-bit integers
+TYPED_ARRAY_TYPES = {
+    np.dtype(np.int8): "i1", np.dtype(np.uint8): "u1",
+    np.dtype(np.int16): "i2", np.dtype(np.uint16): "u2",
+    np.dtype(np.int32): "i4", np.dtype(np.uint32): "u4",
+    np.dtype(np.float32): "f4", np.dtype(np.float64): "f8",
+}
+
+
+# Helper function to encode a numeric array as a plotly.js typed array spec
+def typed_array(array):
+    if array.dtype.kind == "b":
+        array = array.astype(np.uint8)
+    elif array.dtype.kind in "iu":
+        # Integers are narrowed to the smallest type holding them, doubles beyond 32 bits
+        low, high = (array.min(), array.max()) if array.size else (0, 0)
+        for candidate in (np.int8, np.uint8, np.int16, np.uint16, np.int32, np.uint32, np.float64):
+            if candidate is np.float64 or np.iinfo(candidate).min <= low and high <= np.iinfo(candidate).max:
+                array = array.astype(candidate, copy=False)
+                break
+
+    spec = {
+        "dtype": TYPED_ARRAY_TYPES[array.dtype],
+        "bdata": base64.b64encode(np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))).decode("ascii"),
+    }
+    if array.ndim > 1:
+        spec["shape"] = ", ".join(map(str, array.shape))
+    return spec
+
+
+# Helper function to replace the long numeric arrays of a figure dict by typed arrays, recursively
+def encode_arrays(value):
+    if isinstance(value, dict):
+        return {key: encode_arrays(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_arrays(item) for item in value]
+    if isinstance(value, np.ndarray) and value.dtype.kind in "iufb" and len(value) >= MIN_TYPED_ARRAY_LENGTH:
+        return typed_array(value)
+    return value
+
+
+# Helper function to get the dict of a figure to return from a callback, with its numeric data as typed arrays.
+# Typed arrays are smaller than JSON numbers and are decoded by plotly.js without parsing
+@stage("serialize")
+def encode_figure(figure):
+    figure = figure.to_plotly_json()
+    figure["data"] = encode_arrays(figure["data"])
+    return figure
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+# Load the graphs dataset as exported from the source data
+df = pd.read_parquet('../datasets/_dataset_graphs.parquet')
+
+# Split the "lat, lon" strings into float32 coordinate columns
+df[['start_lat', 'start_lon']] = df['Geocoded_City1'].str.split(', ', expand=True).astype('float32')
+df[['end_lat', 'end_lon']] = df['Geocoded_City2'].str.split(', ', expand=True).astype('float32')
+df = df.drop(columns=['Geocoded_City1', 'Geocoded_City2'])
+
+
+# Remove "(Metropolitan Area)" from the city names, cleaning each distinct name only once.
+# Missing cities get the code -1, taken as missing again instead of as the last name
+def clean_city_names(cities):
+    codes, names = pd.factorize(cities)
+    names = names.str.replace('(Metropolitan Area)', '', regex=False).str.strip()
+    return pd.Series(names.take(codes, allow_fill=True, fill_value=np.nan), index=cities.index)
+
+
+df['city1'] = clean_city_names(df['city1'])
+df['city2'] = clean_city_names(df['city2'])
+
+# Precompute the route key used by the box plot selection
+df['route'] = df['city1'] + ' - ' + df['city2']
+
+# Store repeated strings as categoricals, written as dictionary-encoded Parquet columns
+for column in ['city1', 'city2', 'route', 'airport_1', 'airport_2', 'carrier_lg', 'carrier_low']:
+    df[column] = df[column].astype('category')
+
+# Narrow the integer columns
+df = df.astype({'Year': 'int16', 'quarter': 'int8', 'nsmiles': 'int32', 'passengers': 'int32'})
+
+# Save the serving-ready dataset loaded by app.py
+df.to_parquet('../datasets/_dataset_graphs_serving.parquet', index=False)
+print(f"Wrote {len(df)} rows to ../datasets/_dataset_graphs_serving.parquet")
@@ -1,160 +1,301 @@
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+from collections import namedtuple
+from functools import partial
+
+import numpy as np
 import pandas as pd
 from tabulate import tabulate
 
-# Load the preprocessed dataset
-df = pd.read_parquet('../datasets/_dataset.parquet')  # Adjust path if needed
+# Make the app's modules importable when running from the files directory
+sys.path.insert(0, '..')
+from aggregation import AGGREGATION_PROCESSES, map_partitions, merge_distinct, merge_max, merge_sums
+from datastore import open_dataset, parse_years
 
 # List of columns to inspect
 columns_to_check = [
     'Year', 'Quarter', 'OriginCityMarketId', 'DestinationCityMarketId',
-    'OriginCity', 'DestinationCity', 'OriginAirportId', 'DestinationAirportId', 
-    'OriginAirportCode', 'DestinationAirportCode', 'RouteDistanceInMiles', 'PassengerCount', 
-    'AverageFare', 'LargestCarrierCode', 'LargestCarrierMarketShare', 'LargestCarrierAverageFare', 
-    'LowestFareCarrierCode', 'LowestFareMarketShare', 'LowestFare', 
+    'OriginCity', 'DestinationCity', 'OriginAirportId', 'DestinationAirportId',
+    'OriginAirportCode', 'DestinationAirportCode', 'RouteDistanceInMiles', 'PassengerCount',
+    'AverageFare', 'LargestCarrierCode', 'LargestCarrierMarketShare', 'LargestCarrierAverageFare',
+    'LowestFareCarrierCode', 'LowestFareMarketShare', 'LowestFare',
     'OriginCityCoordinates', 'DestinationCityCoordinates', 'Route'
 ]
 
-# Create a list to hold rows for the table
-table_data = []
-
-# Loop through each specified column and calculate required statistics
-for column in columns_to_check:
-    if column in df.columns:
-        total_count = df[column].count()
-        unique_count = df[column].nunique()
-        table_data.append([column, total_count, unique_count])
-    else:
-        table_data.append([column, "Not found", "Not found"])
-
-# Print the table using tabulate
-print(tabulate(table_data, headers=["Column Name", "Total Count", "Unique Count"], tablefmt="grid"))
-
-###########################################################################################################
-
-# Combine specified pairs of columns and find unique values
-unique_cities = pd.concat([df['OriginCity'], df['DestinationCity']]).unique()
-unique_airports = pd.concat([df['OriginAirportCode'], df['DestinationAirportCode']]).unique()
-unique_city_market_ids = pd.concat([df['OriginCityMarketId'], df['DestinationCityMarketId']]).unique()
-unique_airport_ids = pd.concat([df['OriginAirportId'], df['DestinationAirportId']]).unique()
-unique_carrier_codes = pd.concat([df['LargestCarrierCode'], df['LowestFareCarrierCode']]).unique()
-unique_routes = df['Route'].unique()
-
-# Count of unique values
-table_data = [
-    ["Unique Cities", len(unique_cities), unique_cities],
-    ["Unique Airports", len(unique_airports), unique_airports],
-    ["Unique City Market IDs", len(unique_city_market_ids), unique_city_market_ids],
-    ["Unique Airport IDs", len(unique_airport_ids), unique_airport_ids],
-    ["Unique Carrier Codes", len(unique_carrier_codes), unique_carrier_codes],
-    ["Unique Routes", len(unique_routes), unique_routes]
+# Pairs of columns whose values are counted together as one set of distinct values
+unique_pairs = [
+    ("Unique Cities", 'OriginCity', 'DestinationCity'),
+    ("Unique Airports", 'OriginAirportCode', 'DestinationAirportCode'),
+    ("Unique City Market IDs", 'OriginCityMarketId', 'DestinationCityMarketId'),
+    ("Unique Airport IDs", 'OriginAirportId', 'DestinationAirportId'),
+    ("Unique Carrier Codes", 'LargestCarrierCode', 'LowestFareCarrierCode'),
+    ("Unique Routes", 'Route', None),
 ]
 
-# Print the results in a table
-print(tabulate(table_data, headers=["Description", "Unique Count", "Unique Values (Sample)"], tablefmt="grid"))
-
-###########################################################################################################
-
-# Calculate the total passenger count
-total_passenger_count = df['PassengerCount'].sum()
-
-# Print the result
-print(f"Total Passenger Count: {total_passenger_count}")
-
-###########################################################################################################
-
-# Aggregate PassengerCount by Year and sort by Year
-passenger_count_by_year = df.groupby('Year')['PassengerCount'].sum().reset_index()
-passenger_count_by_year = passenger_count_by_year.sort_values(by='Year')
-
-# Calculate the total passenger count
-total_passenger_count = passenger_count_by_year['PassengerCount'].sum()
-
-# Add a row for the total passenger count using pd.concat
-total_row = pd.DataFrame({'Year': ['Total'], 'PassengerCount': [total_passenger_count]})
-passenger_count_by_year = pd.concat([passenger_count_by_year, total_row], ignore_index=True)
-
-# Format PassengerCount column to avoid scientific notation and add commas
-passenger_count_by_year['PassengerCount'] = passenger_count_by_year['PassengerCount'].apply(lambda x: f"{x:,.0f}")
-
-# Print the result in a tabular format
-print(tabulate(passenger_count_by_year, headers=["Year", "Total Passenger Count"], tablefmt="grid"))
-
-###########################################################################################################
-
-# Aggregate PassengerCount by DestinationCity and find the top 10 cities by arrivals
-top_arrival_cities = df.groupby('DestinationCity')['PassengerCount'].sum().reset_index()
-top_arrival_cities = top_arrival_cities.sort_values(by='PassengerCount', ascending=False).head(10)
-
-# Print the result in tabular format
-print("Top 10 Cities by Arrivals (Passenger Count):")
-print(tabulate(top_arrival_cities, headers=["City", "Total Passenger Count"], tablefmt="grid"))
-
-###########################################################################################################
-
-# Aggregate PassengerCount by OriginCity and find the top 10 cities by departures
-top_departure_cities = df.groupby('OriginCity')['PassengerCount'].sum().reset_index()
-top_departure_cities = top_departure_cities.sort_values(by='PassengerCount', ascending=False).head(10)
-
-# Print the result in tabular format
-print("Top 10 Cities by Departures (Passenger Count):")
-print(tabulate(top_departure_cities, headers=["City", "Total Passenger Count"], tablefmt="grid"))
-
-###########################################################################################################
-
-# Aggregate PassengerCount by DestinationAirportCode and find the top 10 airports by arrivals
-top_arrival_airports = df.groupby('DestinationAirportCode')['PassengerCount'].sum().reset_index()
-top_arrival_airports = top_arrival_airports.sort_values(by='PassengerCount', ascending=False).head(10)
-
-# Print the result in tabular format
-print("Top 10 Airports by Arrivals (Passenger Count):")
-print(tabulate(top_arrival_airports, headers=["Airport Code", "Total Passenger Count"], tablefmt="grid"))
-
-###########################################################################################################
-
-# Aggregate PassengerCount by OriginAirportCode and find the top 10 airports by departures
-top_departure_airports = df.groupby('OriginAirportCode')['PassengerCount'].sum().reset_index()
-top_departure_airports = top_departure_airports.sort_values(by='PassengerCount', ascending=False).head(10)
-
-# Print the result in tabular format
-print("Top 10 Airports by Departures (Passenger Count):")
-print(tabulate(top_departure_airports, headers=["Airport Code", "Total Passenger Count"], tablefmt="grid"))
-
-###########################################################################################################
-
-# Aggregate PassengerCount by Route and find the top 10 routes by passenger count
-top_routes = df.groupby('Route')['PassengerCount'].sum().reset_index()
-top_routes = top_routes.sort_values(by='PassengerCount', ascending=False).head(10)
+# Top 10 tables of passenger count by a key column
+top_passenger_tables = [
+    ("Top 10 Cities by Arrivals (Passenger Count)", 'DestinationCity', "City"),
+    ("Top 10 Cities by Departures (Passenger Count)", 'OriginCity', "City"),
+    ("Top 10 Airports by Arrivals (Passenger Count)", 'DestinationAirportCode', "Airport Code"),
+    ("Top 10 Airports by Departures (Passenger Count)", 'OriginAirportCode', "Airport Code"),
+    ("Top 10 Routes by Passenger Count", 'Route', "Route"),
+]
 
-# Print the result in tabular format
-print("Top 10 Routes by Passenger Count:")
-print(tabulate(top_routes, headers=["Route", "Total Passenger Count"], tablefmt="grid"))
+# Columns read from the dataset for each report
+report_columns = {
+    "columns": columns_to_check,
+    "unique": [column for _, *pair in unique_pairs for column in pair if column],
+    "passengers": ['Year', 'PassengerCount'],
+    "top": [column for _, column, _ in top_passenger_tables] + ['PassengerCount'],
+    "distance": ['Route', 'RouteDistanceInMiles'],
+}
+
+# Aggregates each report is computed from: distinct values (with their non-null count) of some
+# columns, passenger sums by some key columns and the largest distance of every route
+report_aggregates = {
+    "columns": {"distinct": columns_to_check},
+    "unique": {"distinct": report_columns["unique"]},
+    "passengers": {"sums": ['Year']},
+    "top": {"sums": [column for _, column, _ in top_passenger_tables]},
+    "distance": {"largest": ['Route']},
+}
 
 ###########################################################################################################
 
-# Remove duplicate entries for each route, keeping only the first occurrence
-unique_routes_df = df.drop_duplicates(subset=['Route'])
 
-# Sort by RouteDistanceInMiles in descending order and get the top 10 longest routes
-top_longest_routes = unique_routes_df.sort_values(by='RouteDistanceInMiles', ascending=False).head(10)
-
-# Select only the relevant columns for display
-top_longest_routes = top_longest_routes[['Route', 'RouteDistanceInMiles']]
-
-# Print the result in tabular format
-print("Top 10 Longest Routes by Distance (in Miles):")
-print(tabulate(top_longest_routes, headers=["Route", "Route Distance (Miles)"], tablefmt="grid"))
+class Scan:
+    """Columns of a Year partition encoded once as integer codes, shared by all its aggregates."""
+
+    def __init__(self, df):
+        self.df = df
+        self.codes = {}
+        self.values = {}
+
+    def encode(self, column):
+        # Factorize each column only once, missing values get the code -1
+        if column not in self.codes:
+            self.codes[column], self.values[column] = pd.factorize(self.df[column])
+        return self.codes[column], self.values[column]
+
+    def group_sum(self, key, measure):
+        # Sum of the measure per distinct key value, as one bincount over the codes
+        codes, values = self.encode(key)
+        present = codes >= 0
+        sums = np.bincount(codes[present], weights=self.df[measure].to_numpy()[present], minlength=len(values))
+        return values, sums
+
+    def group_max(self, key, measure):
+        # Largest value of the measure per distinct key value, whatever the order of the rows
+        codes, values = self.encode(key)
+        present = codes >= 0
+        measures = self.df[measure].to_numpy()[present]
+        maxima = np.full(len(values), np.iinfo(measures.dtype).min if measures.dtype.kind in "iu" else -np.inf,
+                         dtype=measures.dtype)
+        np.maximum.at(maxima, codes[present], measures)
+        return values, maxima
+
+
+# Aggregates of the dataset the reports are computed from, merged over its Year partitions
+Summary = namedtuple("Summary", ["counts", "distinct", "sums", "largest"])
+
+
+# Helper function to compute the partial aggregates of the rows of one Year partition. Distinct
+# values, sums and largest distances are Series or Index in order of first appearance of their keys
+def summarize_partition(df, distinct=(), sums=(), largest=()):
+    scan = Scan(df)
+    summary = Summary({}, {}, {}, {})
+    for column in distinct:
+        if column in df.columns:
+            codes, values = scan.encode(column)
+            summary.counts[column] = int((codes >= 0).sum())
+            summary.distinct[column] = pd.Index(values)
+    for key in sums:
+        values, key_sums = scan.group_sum(key, 'PassengerCount')
+        summary.sums[key] = pd.Series(key_sums, index=pd.Index(values, dtype=object))
+    for key in largest:
+        # The distance of every route is the largest of its rows, as in the routes rollup of the app
+        values, distances = scan.group_max(key, 'RouteDistanceInMiles')
+        summary.largest[key] = pd.Series(distances, index=pd.Index(values, dtype=object))
+    return summary
+
+
+# Helper function to merge the partial aggregates of the Year partitions, taken in the order the
+# dataset reads them so that first appearances are those of the whole dataset
+def merge_summaries(partials):
+    return Summary(
+        counts={column: sum(part.counts[column] for part in partials) for column in partials[0].counts},
+        distinct={column: merge_distinct([part.distinct[column] for part in partials]) for column in partials[0].distinct},
+        sums={key: merge_sums([part.sums[key] for part in partials]) for key in partials[0].sums},
+        largest={key: merge_max([part.largest[key] for part in partials]) for key in partials[0].largest},
+    )
+
+
+# Helper function to select the k largest (or smallest) values without sorting everything
+def top_k(values, k, largest=True):
+    k = min(k, len(values))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    keys = -values if largest else values
+    selected = np.argpartition(keys, k - 1)[:k]
+    return selected[np.argsort(keys[selected], kind="stable")]
+
+
+# Report of the total and unique counts of every column
+def column_report(summary):
+    rows = []
+    for column in columns_to_check:
+        if column in summary.counts:
+            rows.append([column, summary.counts[column], len(summary.distinct[column])])
+        else:
+            rows.append([column, "Not found", "Not found"])
+    return [("Column Summary", ["Column Name", "Total Count", "Unique Count"], rows)]
+
+
+# Report of the distinct values over pairs of origin and destination columns
+def unique_report(summary, sample_size=10):
+    rows = []
+    for description, first, second in unique_pairs:
+        values = summary.distinct[first]
+        if second:
+            values = values.union(summary.distinct[second], sort=False)
+        rows.append([description, len(values), "; ".join(map(str, values[:sample_size]))])
+    return [("Unique Values", ["Description", "Unique Count", "Unique Values (Sample)"], rows)]
+
+
+# Report of the passenger count per year and in total
+def passenger_report(summary):
+    sums = summary.sums['Year']
+    order = np.argsort(sums.index.to_numpy())
+    rows = [[int(sums.index[i]), int(sums.iloc[i])] for i in order]
+    rows.append(["Total", int(sums.sum())])
+    return [("Passenger Count by Year", ["Year", "Total Passenger Count"], rows)]
+
+
+# Report of the top 10 cities, airports and routes by passenger count
+def top_report(summary, k=10):
+    tables = []
+    for title, column, label in top_passenger_tables:
+        values, sums = summary.sums[column].index, summary.sums[column].to_numpy()
+        rows = [[values[i], int(sums[i])] for i in top_k(sums, k)]
+        tables.append((title, [label, "Total Passenger Count"], rows))
+    return tables
+
+
+# Report of the longest and shortest routes, using the largest distance of each route. Routes are
+# sorted by distance then name, like the Top 10 page, so that tied distances list the same routes
+def distance_report(summary, k=10):
+    distances = summary.largest['Route'].rename_axis('Route').rename('Distance').reset_index()
+    rows = distances.sort_values(['Distance', 'Route'], kind="stable")[['Route', 'Distance']].values.tolist()
+    headers = ["Route", "Route Distance (Miles)"]
+    return [
+        ("Top 10 Longest Routes by Distance (in Miles)", headers, rows[::-1][:k]),
+        ("Top 10 Shortest Routes by Distance (in Miles)", headers, rows[:k]),
+    ]
+
+
+reports = {
+    "columns": column_report,
+    "unique": unique_report,
+    "passengers": passenger_report,
+    "top": top_report,
+    "distance": distance_report,
+}
 
 ###########################################################################################################
 
-# Sort by RouteDistanceInMiles in ascending order and get the top 10 shortest routes
-top_shortest_routes = unique_routes_df.sort_values(by='RouteDistanceInMiles').head(10)
-
-# Select only the relevant columns for display
-top_shortest_routes = top_shortest_routes[['Route', 'RouteDistanceInMiles']]
 
-# Print the result in tabular format
-print("Top 10 Shortest Routes by Distance (in Miles):")
-print(tabulate(top_shortest_routes, headers=["Route", "Route Distance (Miles)"], tablefmt="grid"))
+# Helper function to turn numpy scalars into plain Python values for JSON and CSV
+def plain(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def write_grid(tables, out):
+    for title, headers, rows in tables:
+        # Passenger counts are printed with thousands separators
+        if "Total Passenger Count" in headers:
+            position = headers.index("Total Passenger Count")
+            rows = [row[:position] + [f"{row[position]:,.0f}"] + row[position + 1:] for row in rows]
+        print(f"{title}:", file=out)
+        print(tabulate(rows, headers=headers, tablefmt="grid"), file=out)
+
+
+def write_json(tables, out):
+    document = {
+        title: [dict(zip(headers, map(plain, row))) for row in rows]
+        for title, headers, rows in tables
+    }
+    json.dump(document, out, indent=4)
+    print(file=out)
+
+
+def write_csv(tables, out):
+    writer = csv.writer(out)
+    for title, headers, rows in tables:
+        writer.writerow([title])
+        writer.writerow(headers)
+        writer.writerows([map(plain, row) for row in rows])
+        writer.writerow([])
+
+
+# Helper function to write one CSV file per table into a directory
+def write_csv_files(tables, directory):
+    os.makedirs(directory, exist_ok=True)
+    for title, headers, rows in tables:
+        name = re.sub(r"[^a-z0-9]+", "_", title.lower()).strip("_")
+        with open(os.path.join(directory, f"{name}.csv"), "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(headers)
+            writer.writerows([map(plain, row) for row in rows])
+
+
+writers = {"grid": write_grid, "json": write_json, "csv": write_csv}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Summary reports of the preprocessed airline dataset.")
+    parser.add_argument("--dataset", default="../datasets/_dataset",
+                        help="Path of the preprocessed dataset, a Year-partitioned directory or a Parquet file")
+    parser.add_argument("--years", help='Years to include, e.g. "2015-2024" or "2019,2020" (default: all)')
+    parser.add_argument("--report", nargs="+", choices=list(reports), default=list(reports),
+                        help="Reports to compute (default: all)")
+    parser.add_argument("--format", choices=list(writers), default="grid", help="Output format (default: grid)")
+    parser.add_argument("--output", help="Output file, or directory of one file per table for csv (default: stdout)")
+    parser.add_argument("--processes", type=int, default=AGGREGATION_PROCESSES,
+                        help="Processes aggregating the Year partitions (default: every core)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Read only the columns used by the selected reports, and only the partitions of the selected years
+    available = set(open_dataset(args.dataset).schema.names)
+    columns = sorted({column for report in args.report for column in report_columns[report]} & available)
+
+    # Every Year partition is aggregated in its own process, then the partial aggregates are merged
+    aggregates = {
+        kind: sorted({column for report in args.report for column in report_aggregates[report].get(kind, [])})
+        for kind in ("distinct", "sums", "largest")
+    }
+    partials = map_partitions(
+        partial(summarize_partition, **aggregates), args.dataset, columns, parse_years(args.years), args.processes
+    )
+    summary = merge_summaries(partials)
+
+    tables = [table for report in args.report for table in reports[report](summary)]
+
+    if args.output and args.format == "csv":
+        write_csv_files(tables, args.output)
+    elif args.output:
+        with open(args.output, "w", newline="") as out:
+            writers[args.format](tables, out)
+    else:
+        writers[args.format](tables, sys.stdout)
 
-###########################################################################################################
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import csv
+import os
+import sys
+
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Make the app's modules importable when running from the files directory
+sys.path.insert(0, '..')
+from datastore import PARTITION_COLUMN, open_dataset, write_partition_file
+from preprocessing_code import (
+    clean_table, columns, csv_path, dataset_path, open_raw_csv, output_schema, rollups_path,
+)
+from rollups import update_rollups
+
+
+# Helper function to read, validate and clean one quarterly extract of the raw CSV
+def read_quarter(input_path):
+    with open(input_path, newline='') as file:
+        header = next(csv.reader(file), [])
+    if len(header) != len(columns):
+        raise SystemExit(f"{input_path}: expected {len(columns)} columns, found {len(header)}")
+
+    table, missing_count = clean_table(open_raw_csv(input_path).read_all())
+    if table.num_rows == 0:
+        raise SystemExit(f"{input_path}: no rows left after dropping missing values")
+
+    # A quarterly extract holds exactly one Year/Quarter
+    quarters = table.group_by(['Year', 'Quarter']).aggregate([]).to_pylist()
+    if len(quarters) != 1:
+        found = ", ".join(f"{row['Year']} Q{row['Quarter']}" for row in quarters)
+        raise SystemExit(f"{input_path}: expected a single quarter, found {found}")
+    year, quarter = quarters[0]['Year'], quarters[0]['Quarter']
+    if quarter not in (1, 2, 3, 4):
+        raise SystemExit(f"{input_path}: invalid quarter {quarter}")
+
+    return table, year, quarter, missing_count
+
+
+# Helper function to drop the rows of one quarter from the files of its Year partition. A file holding
+# other quarters too is rewritten without it and renamed over the original, so a failure leaves
+# every file either as it was or without the quarter, and the other quarters are never lost
+def remove_quarter(year, quarter):
+    partition = os.path.join(dataset_path, f"{PARTITION_COLUMN}={year}")
+    for name in sorted(os.listdir(partition)):
+        # Hidden files are ignored by the dataset, e.g. the files being written
+        if name.startswith(('.', '_')):
+            continue
+        table = pq.ParquetFile(os.path.join(partition, name)).read()
+        in_quarter = pc.equal(table['Quarter'], quarter)
+        if not pc.any(in_quarter).as_py():
+            continue
+        kept = table.filter(pc.invert(in_quarter))
+        if kept.num_rows:
+            write_partition_file(kept, dataset_path, year, name)
+        else:
+            os.remove(os.path.join(partition, name))
+
+
+def ingest_quarter(input_path, replace=False):
+    if not os.path.isdir(dataset_path):
+        raise SystemExit(f"{dataset_path} not found, run preprocessing_code.py first")
+
+    table, year, quarter, missing_count = read_quarter(input_path)
+    print(f"{input_path}: {year} Q{quarter}, {table.num_rows} rows, {missing_count} rows with missing values dropped")
+
+    # Partition pruning and row-group statistics keep this check to the quarter's own year
+    existing = open_dataset(dataset_path).count_rows(
+        filter=(ds.field('Year') == year) & (ds.field('Quarter') == quarter)
+    )
+    if existing and not replace:
+        raise SystemExit(f"{year} Q{quarter} is already in {dataset_path} ({existing} rows), use --replace")
+    if existing:
+        remove_quarter(year, quarter)
+
+    # The quarter is added as its own file in the Year partition, leaving the other files untouched
+    write_partition_file(
+        table.select(output_schema.names).cast(output_schema), dataset_path, year, f"quarter-{quarter}-0.parquet"
+    )
+
+    # The CSV export can only be appended to
+    if os.path.exists(csv_path) and not existing:
+        with open(csv_path, 'ab') as file:
+            pv.write_csv(table, file, write_options=pv.WriteOptions(include_header=False))
+    elif os.path.exists(csv_path):
+        print(f"{csv_path} still holds the replaced rows, run preprocessing_code.py to regenerate it")
+
+    # Only the rollups of the quarter's year are rebuilt, then merged with those of the other years
+    if os.path.exists(rollups_path):
+        update_rollups(dataset_path, rollups_path, [year])
+
+    print(f"Ingested {year} Q{quarter}: {pc.sum(table['PassengerCount']).as_py()} passengers")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Append one quarterly extract of the raw CSV to the datasets.")
+    parser.add_argument("input", help="Path of the quarterly CSV extract, in the same format as the full CSV")
+    parser.add_argument("--replace", action="store_true", help="Replace the quarter if it was already ingested")
+    args = parser.parse_args(argv)
+
+    ingest_quarter(args.input, args.replace)
+
+
+if __name__ == "__main__":
+    main()
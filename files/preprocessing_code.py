@@ -1,47 +1,157 @@
-import json
-import pandas as pd
+import argparse
+import sys
 
-# Specify the data types for geocoded coordinate columns to treat them as strings
-dtype = {'Geocoded_City1': 'string', 'Geocoded_City2': 'string'}
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
 
-# Load the dataset
-df = pd.read_csv('US Airline Flight Routes and Fares 1993-2024.csv', dtype=dtype)
+# Make the app's modules importable when running from the files directory
+sys.path.insert(0, '..')
+from datastore import write_dataset
+from rollups import update_rollups
 
-# Convert all column names to pascal case
-df.columns = [
+# Pascal case names of the CSV columns, in file order
+columns = [
     'TableId', 'Year', 'Quarter', 'OriginCityMarketId', 'DestinationCityMarketId',
-    'OriginCity', 'DestinationCity', 'OriginAirportId', 'DestinationAirportId', 
-    'OriginAirportCode', 'DestinationAirportCode', 'RouteDistanceInMiles', 'PassengerCount', 
-    'AverageFare', 'LargestCarrierCode', 'LargestCarrierMarketShare', 'LargestCarrierAverageFare', 
-    'LowestFareCarrierCode', 'LowestFareMarketShare', 'LowestFare', 
+    'OriginCity', 'DestinationCity', 'OriginAirportId', 'DestinationAirportId',
+    'OriginAirportCode', 'DestinationAirportCode', 'RouteDistanceInMiles', 'PassengerCount',
+    'AverageFare', 'LargestCarrierCode', 'LargestCarrierMarketShare', 'LargestCarrierAverageFare',
+    'LowestFareCarrierCode', 'LowestFareMarketShare', 'LowestFare',
     'OriginCityCoordinates', 'DestinationCityCoordinates', 'RouteId'
 ]
 
-# Display rows with any missing values
-missing_values_df = df[df.isna().any(axis=1)]
-# print(missing_values_df)
+# Column types of the CSV, fixed up front so that every streamed batch has the same schema
+column_types = {
+    'TableId': pa.string(), 'Year': pa.int64(), 'Quarter': pa.int64(),
+    'OriginCityMarketId': pa.int64(), 'DestinationCityMarketId': pa.int64(),
+    'OriginCity': pa.string(), 'DestinationCity': pa.string(),
+    'OriginAirportId': pa.int64(), 'DestinationAirportId': pa.int64(),
+    'OriginAirportCode': pa.string(), 'DestinationAirportCode': pa.string(),
+    'RouteDistanceInMiles': pa.int64(), 'PassengerCount': pa.int64(), 'AverageFare': pa.float64(),
+    'LargestCarrierCode': pa.string(), 'LargestCarrierMarketShare': pa.float64(),
+    'LargestCarrierAverageFare': pa.float64(), 'LowestFareCarrierCode': pa.string(),
+    'LowestFareMarketShare': pa.float64(), 'LowestFare': pa.float64(),
+    'OriginCityCoordinates': pa.string(), 'DestinationCityCoordinates': pa.string(),
+    'RouteId': pa.string(),
+}
+
+# Schema of the cleaned rows
+output_schema = pa.schema(
+    [(name, type) for name, type in column_types.items() if name not in ('TableId', 'RouteId')]
+    + [('Route', pa.string())]
+)
+
+# Output files of the preprocessing, the Parquet dataset is partitioned by Year
+dataset_path = '../datasets/_dataset'
+csv_path = '../datasets/_dataset.csv'
+rollups_path = '../datasets/_dataset_rollups'
+
+
+def preprocess(input_path):
+    # Specify the data types for geocoded coordinate columns to treat them as strings
+    dtype = {'Geocoded_City1': 'string', 'Geocoded_City2': 'string'}
+
+    # Load the dataset
+    df = pd.read_csv(input_path, dtype=dtype)
+
+    # Convert all column names to pascal case
+    df.columns = columns
+
+    # Count the records before dropping missing values
+    initial_count = len(df)
+    print(f"Record count before dropping missing values: {initial_count}")
+
+    # Count of rows with missing values
+    print(f"Number of rows with missing values: {df.isna().any(axis=1).sum()}")
+
+    # Drop rows with any missing values
+    df = df.dropna()
+
+    # Count the records after dropping missing values
+    final_count = len(df)
+    print(f"Record count after dropping missing values: {final_count}")
+
+    df = df.drop(columns=['TableId', 'RouteId'])
+
+    # Create a new "Route" column by combining "OriginAirportCode" and "DestinationAirportCode"
+    df['Route'] = df['OriginAirportCode'] + '-' + df['DestinationAirportCode']
+
+    # Save the dataset in csv format and as a Year-partitioned parquet dataset
+    write_dataset(pa.Table.from_pandas(df, preserve_index=False), dataset_path)
+    df.to_csv(csv_path, index=False)
+
+    # Save the rollups that feed the Data Summary, Top 10 and Trend pages, built from the Year
+    # partitions in the order the app reads them
+    update_rollups(dataset_path, rollups_path)
+
+
+# Helper function to stream the raw CSV in batches, using our column names in place of the header
+def open_raw_csv(input_path, block_size=None):
+    return pv.open_csv(
+        input_path,
+        read_options=pv.ReadOptions(column_names=columns, skip_rows=1, block_size=block_size),
+        convert_options=pv.ConvertOptions(column_types=column_types, strings_can_be_null=True),
+    )
+
+
+# Helper function to apply the same cleaning as preprocess to an Arrow table
+def clean_table(table):
+    # Rows with any missing value are dropped, only their count is kept
+    cleaned = table.drop_null()
+    missing_count = table.num_rows - cleaned.num_rows
+
+    cleaned = cleaned.drop_columns(['TableId', 'RouteId'])
+    route = pc.binary_join_element_wise(cleaned['OriginAirportCode'], cleaned['DestinationAirportCode'], '-')
+    return cleaned.append_column('Route', route), missing_count
+
+
+# Helper function to clean the CSV batch by batch, also writing the CSV file
+def clean_batches(reader, counts):
+    with pv.CSVWriter(csv_path, output_schema) as csv_writer:
+        for batch in reader:
+            cleaned, missing_count = clean_table(pa.Table.from_batches([batch]))
+            counts['initial'] += batch.num_rows
+            counts['missing'] += missing_count
+
+            csv_writer.write_table(cleaned)
+
+            yield from cleaned.to_batches()
+
+
+def preprocess_streaming(input_path, block_size):
+    # Read the CSV in batches of about block_size bytes
+    reader = open_raw_csv(input_path, block_size)
 
-# Count the records before dropping missing values
-initial_count = len(df)
-print(f"Record count before dropping missing values: {initial_count}")
+    # The cleaned batches are written into the Year partitions as they arrive
+    counts = {'initial': 0, 'missing': 0}
+    write_dataset(clean_batches(reader, counts), dataset_path, schema=output_schema)
 
-# Count of rows with missing values
-print(f"Number of rows with missing values: {len(missing_values_df)}")
+    # The rollups are built from the written partitions, so that only one year at a time is held in
+    # memory in each process, instead of state kept for every batch
+    if counts['initial'] > counts['missing']:
+        update_rollups(dataset_path, rollups_path)
 
-# Drop rows with any missing values
-df = df.dropna()
+    print(f"Record count before dropping missing values: {counts['initial']}")
+    print(f"Number of rows with missing values: {counts['missing']}")
+    print(f"Record count after dropping missing values: {counts['initial'] - counts['missing']}")
 
-# Count the records after dropping missing values
-final_count = len(df)
-print(f"Record count after dropping missing values: {final_count}")
 
-df = df.drop(columns=['TableId', 'RouteId'])
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clean the raw airline CSV into the datasets used by the app.")
+    parser.add_argument("--input", default='US Airline Flight Routes and Fares 1993-2024.csv', help="Path of the raw CSV")
+    parser.add_argument("--stream", action="store_true",
+                        help="Read the CSV in bounded batches so memory use does not grow with the file size")
+    parser.add_argument("--block-size", type=int, default=16 * 1024 * 1024,
+                        help="Approximate size in bytes of each streamed batch (default: 16 MiB)")
+    args = parser.parse_args(argv)
 
-# Create a new "Route" column by combining "OriginAirportCode" and "DestinationAirportCode"
-df['Route'] = df['OriginAirportCode'] + '-' + df['DestinationAirportCode']
+    if args.stream:
+        preprocess_streaming(args.input, args.block_size)
+    else:
+        preprocess(args.input)
 
-# print(json.dumps(list(df.columns), indent=4))
 
-# Save the dataset in csv format and parquet format
-df.to_parquet('../datasets/_dataset.parquet', index=False)
-df.to_csv('../datasets/_dataset.csv', index=False)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import diskcache
+
+# The background callbacks fork the worker that starts them, see app.py. A child forked while
+# another thread of the worker is inside SQLite inherits the locks of that thread and blocks on
+# the files it shares with the worker, so forks wait for the SQLite calls in progress to end
+_condition = threading.Condition(threading.Lock())
+_active = 0
+_forking = False
+
+# Per-thread depth of the guarded calls, nested calls go through while a fork waits
+_local = threading.local()
+
+
+@contextmanager
+def sqlite_guard():
+    """Keep the process from forking while SQLite is used in the block."""
+    global _active
+    depth = getattr(_local, "depth", 0)
+    if not depth:
+        with _condition:
+            while _forking:
+                _condition.wait()
+            _active += 1
+    _local.depth = depth + 1
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        if not depth:
+            with _condition:
+                _active -= 1
+                _condition.notify_all()
+
+
+def _before_fork():
+    global _forking
+    _condition.acquire()
+    _forking = True
+    while _active:
+        _condition.wait()
+
+
+def _after_fork_in_parent():
+    global _forking
+    _forking = False
+    _condition.notify_all()
+    _condition.release()
+
+
+def _after_fork_in_child():
+    global _active, _forking
+    # The threads of the parent do not exist in the child
+    _active, _forking = 0, False
+    _local.__dict__.clear()
+    _condition.release()
+
+
+os.register_at_fork(before=_before_fork, after_in_parent=_after_fork_in_parent, after_in_child=_after_fork_in_child)
+
+
+class PeriodicFlush:
+    """Call a flush function every few seconds from a daemon thread of the process, and at exit.
+
+    Counters buffered in memory are then written to the SQLite files shared by the workers in
+    one transaction per interval, instead of one per request. The thread does not survive a
+    fork, start() runs a new one in the child the first time it is called there.
+    """
+
+    def __init__(self, function, interval):
+        self.function = function
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pid = None
+        os.register_at_fork(after_in_child=self._after_fork_in_child)
+        atexit.register(self._flush)
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name="periodic-flush", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self._flush()
+
+    def _flush(self):
+        # A flush that fails is retried with the next one, it never stops the thread
+        try:
+            self.function()
+        except Exception:
+            pass
+
+    def _after_fork_in_child(self):
+        # The lock may have been held by a thread of the parent
+        self._lock = threading.Lock()
+
+
+class ForkSafeCache(diskcache.Cache):
+    """diskcache.Cache of the background callback manager, with the calls it makes guarded against forks."""
+
+    def get(self, *args, **kwargs):
+        with sqlite_guard():
+            return super().get(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        with sqlite_guard():
+            return super().set(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with sqlite_guard():
+            return super().delete(*args, **kwargs)
+
+    def touch(self, *args, **kwargs):
+        with sqlite_guard():
+            return super().touch(*args, **kwargs)
+
+    @contextmanager
+    def transact(self, retry=False):
+        with sqlite_guard(), super().transact(retry):
+            yield
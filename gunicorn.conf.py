@@ -0,0 +1,30 @@
+import gc
+import os
+
+# Production serving settings, read by `gunicorn app:server` from the working directory.
+# Every setting can be overridden with an environment variable.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# Worker processes, each serving requests on its own threads
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+
+# Import the app, and load its data, once in the master process before forking the workers,
+# so that the workers start from shared pages instead of each loading their own copy
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+
+# Move the preloaded objects out of reach of the garbage collector, whose collections in
+# the workers would otherwise write to them and copy the pages they share with the master
+def pre_fork(server, worker):
+    gc.freeze()
+
+
+# Precompute the popular Graphs selections in every worker, which reports itself ready on /ready
+# once they are cached. The first worker computes them, the others wait for it and find them cached
+def post_worker_init(worker):
+    import app
+
+    app.graphs_warmup.start()
@@ -0,0 +1,245 @@
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, request
+
+from forksafe import PeriodicFlush, sqlite_guard
+
+# Upper bounds of the histogram buckets: seconds, bytes of payload, selected values and rows
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1e3, 1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+ROW_BUCKETS = (0, 10, 100, 1e3, 1e4, 1e5, 1e6, 1e7)
+
+# Metrics exported on /metrics: type, help text and histogram buckets
+METRICS = {
+    "dash_callback_duration_seconds": (
+        "histogram", "Wall time of the Dash callback requests, figure cache hits included.", DURATION_BUCKETS,
+    ),
+    "dash_callback_stage_duration_seconds": (
+        "histogram", "Time spent in each stage of the callbacks, without the stages nested in it.", DURATION_BUCKETS,
+    ),
+    "dash_callback_payload_bytes": ("histogram", "Size of the callback responses before compression.", SIZE_BUCKETS),
+    "dash_callback_input_values": ("histogram", "Number of values of the multi-select callback inputs.", COUNT_BUCKETS),
+    "dash_callback_filtered_rows": ("histogram", "Rows of the Graphs data left by the filters.", ROW_BUCKETS),
+    "dash_callback_requests_total": ("counter", "Dash callback requests by response status.", None),
+}
+
+# Seconds between the writes of the observations buffered by each process to the shared store
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 5))
+
+# Content type of the Prometheus text format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Path of the Dash callback requests
+CALLBACK_PATH = "/_dash-update-component"
+
+# Callback of the current request, the label of everything recorded while it runs
+_callback = ContextVar("callback", default="none")
+
+# Per-thread stack of the time spent in the stages nested in each running stage
+_local = threading.local()
+
+# Observations of this process not yet added to the store: (name, labels, bucket) -> value
+_pending = defaultdict(float)
+_pending_pid = os.getpid()
+_lock = threading.Lock()
+
+# A child forked while another thread records an observation would never get the lock
+os.register_at_fork(before=_lock.acquire, after_in_parent=_lock.release, after_in_child=_lock.release)
+
+
+# Helper function to format labels the Prometheus way, e.g. callback="route-map.figure",stage="filter"
+def format_labels(labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    return ",".join(f'{key}="{escape(value)}"' for key, value in sorted(labels.items()))
+
+
+# Helper function to get the bucket label of a value, "+Inf" beyond the last bound
+def bucket_label(value, buckets):
+    index = bisect_left(buckets, value)
+    return repr(float(buckets[index])) if index < len(buckets) else "+Inf"
+
+
+def _add(name, labels, bucket, value):
+    global _pending_pid
+    with _lock:
+        # Observations made before a fork belong to the parent process
+        if _pending_pid != os.getpid():
+            _pending.clear()
+            _pending_pid = os.getpid()
+        _pending[(name, format_labels(labels), bucket)] += value
+
+
+def current_callback():
+    return _callback.get()
+
+
+@contextmanager
+def recording(callback):
+    """Label what is recorded in the block with a callback name, for work done outside the requests."""
+    token = _callback.set(callback)
+    try:
+        yield
+    finally:
+        _callback.reset(token)
+
+
+def observe(name, value, **labels):
+    """Add a value to a histogram, labelled with the current callback unless given another one."""
+    labels.setdefault("callback", _callback.get())
+    _add(name, labels, bucket_label(value, METRICS[name][2]), 1)
+    _add(name, labels, "sum", value)
+    _add(name, labels, "count", 1)
+
+
+def inc(name, amount=1, **labels):
+    """Increase a counter, labelled with the current callback unless given another one."""
+    labels.setdefault("callback", _callback.get())
+    _add(name, labels, "total", amount)
+
+
+@contextmanager
+def stage(name):
+    """Time a stage of the current callback, as a `with` block or a decorator.
+
+    The time of the stages nested in it is left out, so that the stages of a callback add up
+    to the time spent in them, e.g. the figure stage of a callback excludes its filtering.
+    """
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        observe("dash_callback_stage_duration_seconds", elapsed - nested, stage=name)
+
+
+class MetricsStore:
+    """Metrics of all the worker processes on the host, summed in a SQLite file.
+
+    Every process buffers its observations in memory and adds them to the file in one
+    transaction every few seconds, so the workers do not queue for the write lock of the
+    file on every request. /metrics shows the same totals whichever worker serves it, up
+    to what the others buffered since their last write.
+    """
+
+    def __init__(self, path, flush_seconds=METRICS_FLUSH_SECONDS):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        self._flusher = PeriodicFlush(self.flush, flush_seconds)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS samples ("
+                "name TEXT, labels TEXT, bucket TEXT, value REAL, PRIMARY KEY (name, labels, bucket))"
+            )
+
+    def _connect(self):
+        # One connection per thread, reopened after a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def flush(self):
+        with _lock:
+            if _pending_pid != os.getpid() or not _pending:
+                return
+            rows = [(name, labels, bucket, value) for (name, labels, bucket), value in _pending.items()]
+            _pending.clear()
+        conn = self._connect()
+        try:
+            with sqlite_guard(), conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT INTO samples VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(name, labels, bucket) DO UPDATE SET value = value + excluded.value",
+                    rows,
+                )
+        except sqlite3.Error:
+            # Metrics are best effort, a busy or broken file never fails a request
+            pass
+
+    def flush_later(self):
+        """Have the buffered observations written within the flush interval, and at exit."""
+        self._flusher.start()
+
+    def render(self):
+        """Get all the metrics in the Prometheus text format."""
+        self.flush()
+        samples = defaultdict(dict)
+        with sqlite_guard():
+            for name, labels, bucket, value in self._connect().execute("SELECT name, labels, bucket, value FROM samples"):
+                samples[name, labels][bucket] = value
+
+        lines = []
+        for name, (kind, description, buckets) in METRICS.items():
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            for (sample_name, labels), values in sorted(samples.items()):
+                if sample_name != name:
+                    continue
+                if kind == "counter":
+                    lines.append(f"{name}{{{labels}}} {values.get('total', 0):g}")
+                    continue
+                # Histogram buckets are cumulative
+                cumulative = 0
+                for bucket in [repr(float(bound)) for bound in buckets] + ["+Inf"]:
+                    cumulative += values.get(bucket, 0)
+                    lines.append(f'{name}_bucket{{{labels},le="{bucket}"}} {cumulative:g}')
+                lines.append(f"{name}_sum{{{labels}}} {values.get('sum', 0):g}")
+                lines.append(f"{name}_count{{{labels}}} {values.get('count', 0):g}")
+        return "\n".join(lines) + "\n"
+
+
+def instrument(server, store):
+    """Record the wall time, input cardinality, payload size and status of every Dash callback request."""
+
+    @server.before_request
+    def start_callback():
+        if request.path != CALLBACK_PATH:
+            return
+        body = request.get_json(silent=True) or {}
+        callback = str(body.get("output", "unknown"))
+        g.metrics = (_callback.set(callback), time.perf_counter())
+        # The time outside the nested stages is Dash's own work: parsing, the figure cache and the response JSON
+        _local.stack = [0.0]
+        for item in body.get("inputs") or []:
+            if isinstance(item, dict) and isinstance(item.get("value"), list):
+                observe("dash_callback_input_values", len(item["value"]), input=item.get("id"))
+
+    @server.after_request
+    def finish_callback(response):
+        if "metrics" not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics[1]
+        nested = _local.stack.pop() if getattr(_local, "stack", None) else 0.0
+        observe("dash_callback_duration_seconds", elapsed)
+        observe("dash_callback_stage_duration_seconds", elapsed - nested, stage="dispatch")
+        if not response.is_streamed:
+            observe("dash_callback_payload_bytes", response.calculate_content_length() or 0)
+        inc("dash_callback_requests_total", status=response.status_code)
+        store.flush_later()
+        return response
+
+    @server.teardown_request
+    def reset_callback(exception=None):
+        if "metrics" in g:
+            _callback.reset(g.pop("metrics")[0])
+            _local.stack = []
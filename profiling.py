@@ -0,0 +1,186 @@
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from functools import wraps
+
+from flask import abort, g, jsonify, request, send_from_directory
+
+from figure_cache import CACHE_DIR
+
+# Directory of the profiles, shared by every worker process on the host
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(CACHE_DIR, "profiles"))
+
+# Admin token of the X-Profile-Token header, which profiles the request it is sent with and
+# gives access to /profiles. Without it profiles can only be read from PROFILE_DIR
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")
+PROFILE_HEADER = "X-Profile-Token"
+
+# Callbacks profiled on every request, by output (e.g. "route-map.figure") or "all"
+PROFILE_CALLBACKS = {name.strip() for name in os.environ.get("PROFILE_CALLBACKS", "").split(",") if name.strip()}
+
+# Profile the builders of the Data Summary, Top 10 and Trend pages whenever they run
+PROFILE_BUILDERS = os.environ.get("PROFILE_BUILDERS") == "1"
+
+# Number of profiles kept, the oldest ones are deleted beyond it
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 50))
+
+# Frames kept for every traced allocation, more show more of the callers at a higher cost
+TRACEMALLOC_FRAMES = 10
+
+# Lines of the text summary of each profile
+SUMMARY_LINES = 30
+
+# Path of the Dash callback requests
+CALLBACK_PATH = "/_dash-update-component"
+
+# cProfile allows one active profiler per process in recent Python versions, and tracemalloc
+# traces the whole process, so one invocation is profiled at a time and the others run as usual
+_lock = threading.Lock()
+
+
+# Helper function to turn a callback output into a file name part, e.g. "route-map.figure"
+def profile_slug(name):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("_.") or "profile"
+
+
+# Helper function to start profiling the current thread, None when another profile is running
+def start_profile():
+    if not _lock.acquire(blocking=False):
+        return None
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler, tracing
+
+
+# Helper function to stop a profile and write its files, returning the id they are named after
+def stop_profile(session, name):
+    profiler, tracing = session
+    try:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        if not tracing:
+            tracemalloc.stop()
+    finally:
+        _lock.release()
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{profile_slug(name)}"
+    path = os.path.join(PROFILE_DIR, profile_id)
+    # .prof opens in pstats, snakeviz or gprof2dot, .tracemalloc with tracemalloc.Snapshot.load
+    profiler.dump_stats(path + ".prof")
+    snapshot.dump(path + ".tracemalloc")
+
+    summary = io.StringIO()
+    summary.write(f"{name}\nTraced memory: {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB\n\n")
+    pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(SUMMARY_LINES)
+    summary.write("Largest allocations still alive at the end, by line:\n")
+    for statistic in snapshot.statistics("lineno")[:SUMMARY_LINES]:
+        summary.write(f"{statistic}\n")
+    with open(path + ".txt", "w") as file:
+        file.write(summary.getvalue())
+
+    remove_old_profiles()
+    return profile_id
+
+
+# Helper function to delete the oldest profiles beyond PROFILE_KEEP
+def remove_old_profiles():
+    profile_ids = sorted({name.rsplit(".", 1)[0] for name in os.listdir(PROFILE_DIR)})
+    for profile_id in profile_ids[:-PROFILE_KEEP] if PROFILE_KEEP else []:
+        for extension in (".prof", ".tracemalloc", ".txt"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, profile_id + extension))
+            except FileNotFoundError:
+                pass
+
+
+def profiled(name):
+    """Profile every call of a page builder when PROFILE_BUILDERS=1, otherwise leave it untouched."""
+
+    def decorator(func):
+        if not PROFILE_BUILDERS:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            session = start_profile()
+            if session is None:
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stop_profile(session, name)
+
+        return wrapper
+
+    return decorator
+
+
+# Helper function to check the admin token of a request
+def has_token():
+    token = request.headers.get(PROFILE_HEADER)
+    return bool(PROFILE_TOKEN and token and hmac.compare_digest(token, PROFILE_TOKEN))
+
+
+def instrument(server):
+    """Profile the callback requests selected by PROFILE_CALLBACKS or sent with the admin token.
+
+    Nothing is registered when profiling is off, so it costs nothing then.
+    """
+    if not PROFILE_CALLBACKS and not PROFILE_TOKEN:
+        return
+
+    @server.before_request
+    def start_request_profile():
+        if request.path != CALLBACK_PATH:
+            return
+        callback = str((request.get_json(silent=True) or {}).get("output", "unknown"))
+        if "all" in PROFILE_CALLBACKS or callback in PROFILE_CALLBACKS or has_token():
+            session = start_profile()
+            if session is not None:
+                g.profile = (session, callback)
+
+    @server.after_request
+    def stop_request_profile(response):
+        if "profile" in g:
+            session, callback = g.pop("profile")
+            # The id of the profile files is returned, to download them from /profiles
+            response.headers["X-Profile-Id"] = stop_profile(session, callback)
+        return response
+
+    @server.teardown_request
+    def release_request_profile(exception=None):
+        # A request failing before after_request still ends its profile
+        if "profile" in g:
+            session, callback = g.pop("profile")
+            stop_profile(session, callback)
+
+    if not PROFILE_TOKEN:
+        return
+
+    @server.route("/profiles")
+    def list_profiles():
+        if not has_token():
+            abort(403)
+        names = sorted(os.listdir(PROFILE_DIR), reverse=True) if os.path.isdir(PROFILE_DIR) else []
+        return jsonify(names)
+
+    @server.route("/profiles/<path:name>")
+    def download_profile(name):
+        if not has_token():
+            abort(403)
+        return send_from_directory(os.path.abspath(PROFILE_DIR), name, as_attachment=True)
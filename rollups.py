@@ -0,0 +1,141 @@
+import os
+import shutil
+
+import pandas as pd
+
+from aggregation import map_partitions
+from datastore import PARTITION_COLUMN, partition_years
+
+# Grains of the rollups the Data Summary, Top 10 and Trend pages are served from. Each one is
+# bounded by the number of quarters, cities, airports, carriers or routes, not by the row count
+ROLLUP_KEYS = {
+    'quarters': ['Year', 'Quarter'],
+    'distance_categories': ['Year', 'DistanceCategory'],
+    'origin_cities': ['OriginCity'],
+    'destination_cities': ['DestinationCity'],
+    'origin_airports': ['OriginAirportCode'],
+    'destination_airports': ['DestinationAirportCode'],
+    'largest_carriers': ['LargestCarrierCode'],
+    'lowest_fare_carriers': ['LowestFareCarrierCode'],
+    'routes': ['Route'],
+}
+
+# Attributes kept as their largest value for every key. A route's distance varies between its rows, the
+# largest one does not depend on the order the rows are read in, e.g. through the Year partitions
+ROLLUP_MAX = {
+    'routes': ['RouteDistanceInMiles'],
+}
+
+# Measures of every rollup: passenger sums and fare sum/count pairs, from which fare means are merged
+ROLLUP_MEASURES = ['PassengerCount', 'FareSum', 'FareCount']
+
+# Columns of the dataset the rollups are built from
+ROLLUP_COLUMNS = [
+    'Year', 'Quarter', 'OriginCity', 'DestinationCity', 'OriginAirportCode', 'DestinationAirportCode',
+    'LargestCarrierCode', 'LowestFareCarrierCode', 'Route', 'RouteDistanceInMiles', 'PassengerCount', 'AverageFare',
+]
+
+# Route distance categories of the Trend page, in miles
+DISTANCE_BINS = [0, 500, 1500, 3000]
+DISTANCE_CATEGORIES = ['Short', 'Medium', 'Long']
+
+
+# Helper function to store the string keys of a rollup as categoricals
+def categorize(rollup):
+    return rollup.astype({column: 'category' for column in rollup.columns if rollup[column].dtype == object})
+
+
+# Helper function to pre-aggregate rows of the dataset into every rollup
+def build_rollups(df):
+    df = df.assign(
+        DistanceCategory=pd.cut(df['RouteDistanceInMiles'], bins=DISTANCE_BINS, labels=DISTANCE_CATEGORIES),
+    )
+    rollups = {}
+    for name, keys in ROLLUP_KEYS.items():
+        aggregations = {
+            'PassengerCount': ('PassengerCount', 'sum'),
+            'FareSum': ('AverageFare', 'sum'),
+            'FareCount': ('AverageFare', 'count'),
+        }
+        aggregations.update({column: (column, 'max') for column in ROLLUP_MAX.get(name, [])})
+        # sort=False keeps the keys in order of first appearance, as the rows were
+        rollup = df.groupby(keys, sort=False, observed=True).agg(**aggregations)
+        rollups[name] = categorize(rollup.reset_index())
+    return rollups
+
+
+# Helper function to merge partial rollups, e.g. of CSV batches or year partitions, in the order they were read
+def merge_rollups(partials):
+    rollups = {}
+    for name, keys in ROLLUP_KEYS.items():
+        rollup = pd.concat([partial[name] for partial in partials], ignore_index=True)
+        aggregations = dict.fromkeys(ROLLUP_MEASURES, 'sum')
+        aggregations.update(dict.fromkeys(ROLLUP_MAX.get(name, []), 'max'))
+        rollup = rollup.groupby(keys, sort=False, observed=True).agg(aggregations)
+        rollups[name] = categorize(rollup.reset_index())
+    return rollups
+
+
+# Helper function to build the rollups of the dataset, one Year partition per process
+def rollup_dataset(path, years=None):
+    return merge_rollups(map_partitions(build_rollups, path, ROLLUP_COLUMNS, years))
+
+
+# Helper function to write the rollups as one Parquet file each in a directory. Every file is
+# written aside and renamed over the previous one, so readers never see a partial file
+def write_rollups(rollups, path):
+    os.makedirs(path, exist_ok=True)
+    for name, rollup in rollups.items():
+        rollup_path = os.path.join(path, f"{name}.parquet")
+        temporary_path = f"{rollup_path}.{os.getpid()}.tmp"
+        rollup.to_parquet(temporary_path, index=False)
+        os.replace(temporary_path, rollup_path)
+
+
+# Helper function to get the directory of the rollups of one year
+def year_rollups_path(path, year):
+    return os.path.join(path, f"{PARTITION_COLUMN}={year}")
+
+
+# Helper function to read the rollups written by update_rollups: those of every year or, for a
+# selection of years, the merged rollups of each of these years found in the directory. Without
+# any of these years they are empty, with the columns of the rollups of every year, like a dataset
+# read with these years only
+def read_rollups(path, years=None):
+    if years:
+        partials = [
+            read_rollups(year_rollups_path(path, year)) for year in years if os.path.isdir(year_rollups_path(path, year))
+        ]
+        if not partials:
+            return {name: rollup.iloc[:0] for name, rollup in read_rollups(path).items()}
+        return merge_rollups(partials)
+    return {name: pd.read_parquet(os.path.join(path, f"{name}.parquet")) for name in ROLLUP_KEYS}
+
+
+# Helper function to rebuild the rollups of some years of the Year-partitioned dataset, every year by
+# default, then merge those of every year. The rollups of each year are kept in their own Year=<year>
+# directory, so that a new quarter rebuilds those of its year only, from its partition
+def update_rollups(dataset_path, path, years=None):
+    # The years are merged in the order the dataset reads them, so that first appearances are kept
+    all_years = [year for [year] in partition_years(dataset_path)]
+    if years is not None:
+        # Years without rollups of their own yet are built too
+        years = sorted(set(years) | {year for year in all_years if not os.path.isdir(year_rollups_path(path, year))})
+    elif os.path.isdir(path):
+        # Drop the rollups of years no longer in the dataset
+        for name in set(os.listdir(path)) - {f"{PARTITION_COLUMN}={year}" for year in all_years}:
+            if name.startswith(f"{PARTITION_COLUMN}="):
+                shutil.rmtree(os.path.join(path, name))
+
+    partitions = partition_years(dataset_path, years)
+    for [year], rollups in zip(partitions, map_partitions(build_rollups, dataset_path, ROLLUP_COLUMNS, years)):
+        write_rollups(rollups, year_rollups_path(path, year))
+    write_rollups(read_rollups(path, all_years), path)
+
+
+# Helper function to pick the smallest rollup grouped by some keys, the rollups are listed smallest first
+def rollup_name(keys):
+    for name, rollup_keys in ROLLUP_KEYS.items():
+        if set(keys) <= set(rollup_keys):
+            return name
+    raise KeyError(f"no rollup is grouped by {keys}")
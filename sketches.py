@@ -0,0 +1,82 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Relative accuracy of the sketched quantiles, each one is within 1% of a value of the data
+SKETCH_ACCURACY = 0.01
+GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+
+# Smallest value told apart by the sketches, smaller values share its bucket
+MIN_VALUE = 0.01
+
+# Mergeable quantile sketches of a column: counts of values per logarithmic bucket and group,
+# with the exact min, max and count of each group
+Sketches = namedtuple('Sketches', ['buckets', 'summary'])
+
+
+# Helper function to get the bucket of every value, bucket k holds the values in (GAMMA^(k-1), GAMMA^k]
+def bucket_keys(values):
+    return np.ceil(np.log(np.maximum(values, MIN_VALUE)) / np.log(GAMMA)).astype(np.int16)
+
+
+# Helper function to get the value standing for the values of a bucket, within SKETCH_ACCURACY of all of them
+def bucket_values(keys):
+    return 2 * GAMMA ** keys.astype(np.float64) / (GAMMA + 1)
+
+
+# Helper function to sketch a column for every group of some keys, e.g. the fares per route and year
+def build_sketches(df, keys, column):
+    values = df[column].to_numpy()
+    buckets = (
+        df[keys].assign(Bucket=bucket_keys(values))
+        .groupby(keys + ['Bucket'], observed=True).size().rename('Count').reset_index()
+    )
+    summary = df.groupby(keys, observed=True)[column].agg(Min='min', Max='max', Count='count').reset_index()
+    return Sketches(buckets, summary)
+
+
+# Helper function to keep the sketches of the groups whose keys take some values, an empty selection keeps all
+def select_sketches(sketches, **selections):
+    def select(table):
+        mask = np.ones(len(table), dtype=bool)
+        for key, values in selections.items():
+            if values:
+                mask &= table[key].isin(values).to_numpy()
+        return table[mask]
+
+    return Sketches(select(sketches.buckets), select(sketches.summary))
+
+
+# Helper function to merge the sketches into one per group of fewer keys, e.g. per route over the years
+def merge_sketches(sketches, keys):
+    buckets = sketches.buckets.groupby(keys + ['Bucket'], observed=True)['Count'].sum().reset_index()
+    summary = sketches.summary.groupby(keys, observed=True).agg(
+        Min=('Min', 'min'), Max=('Max', 'max'), Count=('Count', 'sum')
+    ).reset_index()
+    return Sketches(buckets, summary)
+
+
+# Helper function to get the box plot statistics of a sketch: quartiles and Tukey fences at 1.5 IQR
+def box_statistics(buckets, low, high):
+    buckets = buckets.sort_values('Bucket')
+    values = np.clip(bucket_values(buckets['Bucket'].to_numpy()), low, high)
+    # The first and last buckets hold the exact min and max
+    values[0], values[-1] = low, high
+    cumulative = np.cumsum(buckets['Count'].to_numpy())
+
+    # Value of rank q * (n - 1), interpolated between the values of the ranks around it like plotly's
+    # linear quartile method, where the value of a rank is the value of the bucket holding it
+    def quantile(q):
+        rank = q * (cumulative[-1] - 1)
+        below, above = values[np.searchsorted(cumulative, [np.floor(rank), np.ceil(rank)], side='right')]
+        return below + (rank - np.floor(rank)) * (above - below)
+
+    q1, median, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+
+    # The whiskers end at the most extreme values within the fences, the exact min and max when inside
+    iqr = q3 - q1
+    lower_limit, upper_limit = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+    lowerfence = low if low >= lower_limit else values[values >= lower_limit].min(initial=q1)
+    upperfence = high if high <= upper_limit else values[values <= upper_limit].max(initial=q3)
+
+    return dict(q1=q1, median=median, q3=q3, lowerfence=lowerfence, upperfence=upperfence)
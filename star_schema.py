@@ -0,0 +1,125 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from rollups import DISTANCE_CATEGORIES, ROLLUP_KEYS, rollup_name
+
+# In-memory star schema of the rollups: deduplicated dimension tables and, for every rollup, a fact
+# table of integer keys and measures
+StarSchema = namedtuple('StarSchema', ['facts', 'cities', 'airports', 'carriers', 'routes'])
+
+# Columns of the dataset replaced by a key into a dimension table: (dimension, label column, key column)
+DIMENSION_KEYS = {
+    'OriginCity': ('cities', 'City', 'OriginCityKey'),
+    'DestinationCity': ('cities', 'City', 'DestinationCityKey'),
+    'OriginAirportCode': ('airports', 'AirportCode', 'OriginAirportKey'),
+    'DestinationAirportCode': ('airports', 'AirportCode', 'DestinationAirportKey'),
+    'LargestCarrierCode': ('carriers', 'CarrierCode', 'LargestCarrierKey'),
+    'LowestFareCarrierCode': ('carriers', 'CarrierCode', 'LowestFareCarrierKey'),
+    'Route': ('routes', 'Route', 'RouteKey'),
+}
+
+# Columns sharing each dimension table
+DIMENSION_COLUMNS = {
+    'cities': ['OriginCity', 'DestinationCity'],
+    'airports': ['OriginAirportCode', 'DestinationAirportCode'],
+    'carriers': ['LargestCarrierCode', 'LowestFareCarrierCode'],
+    'routes': ['Route'],
+}
+
+
+# Narrow types of the other keys of the fact tables
+KEY_TYPES = {'Year': np.int16, 'Quarter': np.int8}
+
+
+# Helper function to pick the narrowest integer type for keys up to some count
+def key_dtype(count):
+    return np.int16 if count <= np.iinfo(np.int16).max else np.int32
+
+
+# Helper function to encode some columns against one shared, sorted dimension of their values
+def encode_shared(columns):
+    values = pd.concat([column.astype(str) for column in columns], ignore_index=True)
+    codes, labels = pd.factorize(values, sort=True)
+    codes = codes.astype(key_dtype(len(labels)))
+    return np.split(codes, np.cumsum([len(column) for column in columns])[:-1]), labels
+
+
+# Helper function to build the fact table of a rollup, with the dimension keys encoded by build_star_schema
+def build_facts(name, rollup, codes):
+    facts = {}
+    for key in ROLLUP_KEYS[name]:
+        if key in DIMENSION_KEYS:
+            facts[DIMENSION_KEYS[key][2]] = codes[name, key]
+        elif key == 'DistanceCategory':
+            facts[key] = pd.Categorical(rollup[key], categories=DISTANCE_CATEGORIES, ordered=True)
+        else:
+            facts[key] = rollup[key].to_numpy(KEY_TYPES[key])
+    facts['PassengerCount'] = rollup['PassengerCount'].to_numpy(np.int64)
+    # Fare sums stay float64, float32 would round the summed fares
+    facts['FareSum'] = rollup['FareSum'].to_numpy(np.float64)
+    facts['FareCount'] = rollup['FareCount'].to_numpy(np.int32)
+    return pd.DataFrame(facts)
+
+
+# Helper function to build the star schema from the rollups
+def build_star_schema(rollups):
+    codes, dimensions = {}, {}
+    for name, columns in DIMENSION_COLUMNS.items():
+        sources = [(rollup_name([column]), column) for column in columns]
+        column_codes, labels = encode_shared([rollups[rollup][column] for rollup, column in sources])
+        codes.update(zip(sources, column_codes))
+        dimensions[name] = pd.DataFrame({DIMENSION_KEYS[columns[0]][1]: labels})
+
+    # The routes rollup lists every route once with its largest distance, in the order of the dimension
+    route_rows = np.empty(len(codes['routes', 'Route']), dtype=np.intp)
+    route_rows[codes['routes', 'Route']] = np.arange(len(route_rows))
+    # The dimension is small, its distance keeps the dataset's int64
+    dimensions['routes']['RouteDistanceInMiles'] = rollups['routes']['RouteDistanceInMiles'].to_numpy(np.int64)[route_rows]
+
+    facts = {name: build_facts(name, rollup, codes) for name, rollup in rollups.items()}
+    return StarSchema(facts=facts, **dimensions)
+
+
+# Helper function to get the fact table columns to group by for some dataset columns
+def fact_keys(keys):
+    keys = [keys] if isinstance(keys, str) else list(keys)
+    return keys, [DIMENSION_KEYS[key][2] if key in DIMENSION_KEYS else key for key in keys]
+
+
+# Helper function to replace the integer keys of an aggregate by the labels of their dimensions
+def label_keys(star, result, keys, columns):
+    for key, column in zip(keys, columns):
+        if key in DIMENSION_KEYS:
+            dimension, label, _ = DIMENSION_KEYS[key]
+            result[column] = getattr(star, dimension)[label].to_numpy()[result[column].to_numpy()]
+    return result.rename(columns=dict(zip(columns, keys)))
+
+
+# Helper function to sum the passengers by some keys, grouping on the integer keys of the smallest
+# fact table having them
+def passenger_sum(star, keys):
+    keys, columns = fact_keys(keys)
+    result = star.facts[rollup_name(keys)].groupby(columns)['PassengerCount'].sum().reset_index()
+    return label_keys(star, result, keys, columns)
+
+
+# Helper function to get the mean fare by some keys, merging the fare sum/count pairs
+def fare_mean(star, keys):
+    keys, columns = fact_keys(keys)
+    fares = star.facts[rollup_name(keys)].groupby(columns)[['FareSum', 'FareCount']].sum()
+    result = (fares['FareSum'] / fares['FareCount']).rename('AverageFare').reset_index()
+    return label_keys(star, result, keys, columns)
+
+
+# Helper function to count the distinct values of some columns taken together, e.g. origin and destination cities
+def distinct_count(star, *columns):
+    keys = [star.facts[rollup_name([column])][fact_keys(column)[1][0]].to_numpy() for column in columns]
+    return len(np.unique(np.concatenate(keys)))
+
+
+# Helper function to get the distance of every route, sorted by distance then route so that tied
+# distances list the same routes whatever the order of the rows
+def route_distances(star):
+    return star.routes.sort_values(['RouteDistanceInMiles', 'Route'], kind='stable')[['Route', 'RouteDistanceInMiles']]
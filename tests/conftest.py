@@ -0,0 +1,49 @@
+import os
+import sys
+from collections import namedtuple
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+# Make the app's modules, the benchmark helpers and the preprocessing scripts importable
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks'), os.path.join(ROOT, 'files')]
+
+from datastore import write_dataset
+from preprocessing_code import output_schema
+from synthetic_data import create_rows, create_universe, dataset_batches, graphs_frame
+
+# Rows of the synthetic data, enough for the busiest routes to appear in many years
+ROWS = 20_000
+SEED = 0
+
+# Preprocessed dataset written Year-partitioned, with the rows it was written from in source order
+Dataset = namedtuple('Dataset', ['path', 'frame'])
+
+
+@pytest.fixture(scope='session')
+def universe():
+    rng = np.random.default_rng(SEED)
+    cities, airports, routes = create_universe(rng)
+    return create_rows(ROWS, rng, routes), cities, airports, routes
+
+
+@pytest.fixture(scope='session')
+def dataset(universe, tmp_path_factory):
+    table = pa.Table.from_batches(list(dataset_batches(*universe)))
+    df = table.to_pandas()
+    rng = np.random.default_rng(SEED)
+    # The distance of a route varies between its rows, as in the real data, and the rows are
+    # shuffled, so that results depending on which row of a route comes first differ from pandas
+    df['RouteDistanceInMiles'] += rng.integers(0, 100, len(df))
+    df = df.sample(frac=1, random_state=SEED, ignore_index=True)
+
+    path = str(tmp_path_factory.mktemp('data') / '_dataset')
+    write_dataset(pa.Table.from_pandas(df, schema=output_schema, preserve_index=False), path, schema=output_schema)
+    return Dataset(path, df)
+
+
+@pytest.fixture(scope='session')
+def graphs(universe):
+    return graphs_frame(*universe)
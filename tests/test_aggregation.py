@@ -0,0 +1,74 @@
+from functools import partial
+
+import pandas as pd
+import pytest
+
+from aggregation import map_partitions, merge_distinct, merge_max, merge_sums
+from data_summary_code import distance_report, merge_summaries, summarize_partition
+from datastore import partition_years
+
+
+# Helper function to split the rows of the dataset into one partial per year, the years in some order
+def year_partials(df, function, years):
+    return [function(df[df['Year'] == year]) for year in years]
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_map_partitions(dataset, processes):
+    # One result per Year partition, in the order the dataset reads them, on a process pool or not
+    years = [year for [year] in partition_years(dataset.path)]
+    counts = map_partitions(len, dataset.path, ['Year'], processes=processes)
+    assert counts == dataset.frame.groupby('Year').size().loc[years].tolist()
+
+
+def test_merge_sums(dataset):
+    df = dataset.frame
+    partials = year_partials(df, lambda rows: rows.groupby(['OriginCity', 'Quarter'])['PassengerCount'].sum(),
+                             df['Year'].unique())
+    expected = df.groupby(['OriginCity', 'Quarter'])['PassengerCount'].sum()
+    pd.testing.assert_series_equal(merge_sums(partials).sort_index(), expected)
+
+
+def test_merge_distinct(dataset):
+    df = dataset.frame
+    years = df['Year'].unique()[::-1]
+    partials = year_partials(df, lambda rows: rows['Route'].unique(), years)
+    # The values come in order of first appearance, as in a single pass over the years in that order
+    rows = pd.concat([df[df['Year'] == year] for year in years])
+    assert merge_distinct(partials).tolist() == rows['Route'].unique().tolist()
+
+
+def test_merge_max(dataset):
+    df = dataset.frame
+    years = sorted(df['Year'].unique())
+    partials = year_partials(df, lambda rows: rows.groupby('Route')['RouteDistanceInMiles'].max(), years)
+    expected = df.groupby('Route')['RouteDistanceInMiles'].max()
+    # The largest value of every key does not depend on the order of the partials
+    pd.testing.assert_series_equal(merge_max(partials).sort_index(), expected)
+    pd.testing.assert_series_equal(merge_max(partials[::-1]).sort_index(), expected)
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_data_summary_matches_pandas(dataset, processes):
+    df = dataset.frame
+    summarize = partial(
+        summarize_partition, distinct=['OriginCity', 'Route'], sums=['Year', 'Route'], largest=['Route'],
+    )
+    summary = merge_summaries(map_partitions(summarize, dataset.path, processes=processes))
+
+    for column in ['OriginCity', 'Route']:
+        assert summary.counts[column] == df[column].notna().sum()
+        assert set(summary.distinct[column]) == set(df[column].unique())
+    for key in ['Year', 'Route']:
+        expected = df.groupby(key)['PassengerCount'].sum()
+        pd.testing.assert_series_equal(summary.sums[key].sort_index(), expected, check_names=False, check_index_type=False,
+                                       check_dtype=False)
+    expected = df.groupby('Route')['RouteDistanceInMiles'].max()
+    pd.testing.assert_series_equal(summary.largest['Route'].sort_index(), expected, check_names=False,
+                                   check_index_type=False)
+
+    # The longest and shortest routes are sorted by distance, then name, like the Top 10 page
+    routes = expected.reset_index().sort_values(['RouteDistanceInMiles', 'Route'])[['Route', 'RouteDistanceInMiles']]
+    (_, _, longest), (_, _, shortest) = distance_report(summary)
+    assert longest == routes.values.tolist()[::-1][:10]
+    assert shortest == routes.values.tolist()[:10]
@@ -0,0 +1,54 @@
+import pandas as pd
+
+from rollups import (
+    DISTANCE_BINS, DISTANCE_CATEGORIES, ROLLUP_KEYS, ROLLUP_MAX, read_rollups, rollup_dataset, update_rollups,
+)
+
+
+# Helper function to aggregate the rows of the dataset into a rollup with pandas, row by row
+def direct_rollup(df, name):
+    df = df.assign(
+        DistanceCategory=pd.cut(df['RouteDistanceInMiles'], bins=DISTANCE_BINS, labels=DISTANCE_CATEGORIES),
+    )
+    aggregations = {
+        'PassengerCount': ('PassengerCount', 'sum'),
+        'FareSum': ('AverageFare', 'sum'),
+        'FareCount': ('AverageFare', 'count'),
+    }
+    aggregations.update({column: (column, 'max') for column in ROLLUP_MAX.get(name, [])})
+    return df.groupby(ROLLUP_KEYS[name], observed=True).agg(**aggregations).reset_index()
+
+
+# Helper function to compare rollups regardless of the order of their keys and of their string types
+def assert_rollups_equal(rollups, expected):
+    assert set(rollups) == set(expected)
+    for name, keys in ROLLUP_KEYS.items():
+        left, right = (
+            frame.astype({key: str for key in keys if key != 'DistanceCategory'})
+            .sort_values(keys, ignore_index=True)
+            for frame in (rollups[name], expected[name])
+        )
+        pd.testing.assert_frame_equal(left, right[left.columns], check_dtype=False, check_categorical=False)
+
+
+def test_rollups_match_pandas(dataset):
+    expected = {name: direct_rollup(dataset.frame, name) for name in ROLLUP_KEYS}
+    assert_rollups_equal(rollup_dataset(dataset.path), expected)
+
+
+def test_read_rollups_of_some_years(dataset, tmp_path):
+    update_rollups(dataset.path, str(tmp_path))
+    pd.testing.assert_frame_equal(read_rollups(str(tmp_path))['routes'], rollup_dataset(dataset.path)['routes'])
+
+    years = [2001, 2002, 2015]
+    df = dataset.frame[dataset.frame['Year'].isin(years)]
+    expected = {name: direct_rollup(df, name) for name in ROLLUP_KEYS}
+    assert_rollups_equal(read_rollups(str(tmp_path), years), expected)
+
+
+def test_read_rollups_without_the_years(dataset, tmp_path):
+    update_rollups(dataset.path, str(tmp_path))
+    rollups = read_rollups(str(tmp_path), [1800])
+    for name, rollup in read_rollups(str(tmp_path)).items():
+        assert rollups[name].empty
+        assert list(rollups[name].columns) == list(rollup.columns)
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from sketches import SKETCH_ACCURACY, box_statistics, build_sketches, merge_sketches, select_sketches
+
+
+# Helper function to compare sketches regardless of the order of their groups
+def assert_sketches_equal(sketches, expected, keys):
+    for table, expected_table, table_keys in [
+        (sketches.buckets, expected.buckets, keys + ['Bucket']),
+        (sketches.summary, expected.summary, keys),
+    ]:
+        left, right = (
+            frame.astype({key: str for key in keys}).sort_values(table_keys, ignore_index=True)
+            for frame in (table, expected_table)
+        )
+        pd.testing.assert_frame_equal(left, right, check_dtype=False)
+
+
+def test_merge_sketches(graphs):
+    # The sketches per route and year merged over the years are those built per route
+    sketches = build_sketches(graphs, ['route', 'Year'], 'fare')
+    assert_sketches_equal(merge_sketches(sketches, ['route']), build_sketches(graphs, ['route'], 'fare'), ['route'])
+
+
+def test_select_sketches(graphs):
+    years = [1995, 2010, 2020]
+    routes = graphs['route'].value_counts().index[:5].tolist()
+    sketches = select_sketches(build_sketches(graphs, ['route', 'Year'], 'fare'), route=routes, Year=years)
+    rows = graphs[graphs['route'].isin(routes) & graphs['Year'].isin(years)]
+    assert_sketches_equal(merge_sketches(sketches, ['route']), build_sketches(rows, ['route'], 'fare'), ['route'])
+
+
+def test_box_statistics(graphs):
+    # The quartiles of the busiest routes are within the accuracy of the sketches of the exact ones,
+    # computed with the linear method of plotly's box plots
+    sketches = build_sketches(graphs, ['route'], 'fare')
+    summary = sketches.summary.set_index('route')
+    for route in graphs['route'].value_counts().index[:20]:
+        fares = graphs.loc[graphs['route'] == route, 'fare'].to_numpy()
+        statistics = box_statistics(
+            sketches.buckets[sketches.buckets['route'] == route], summary.at[route, 'Min'], summary.at[route, 'Max']
+        )
+        expected = dict(zip(['q1', 'median', 'q3'], np.quantile(fares, [0.25, 0.5, 0.75])))
+        for name, value in expected.items():
+            assert abs(statistics[name] - value) <= SKETCH_ACCURACY * value, (route, name)
+        assert fares.min() <= statistics['lowerfence'] <= statistics['q1']
+        assert statistics['q3'] <= statistics['upperfence'] <= fares.max()
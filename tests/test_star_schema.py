@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rollups import rollup_dataset
+from star_schema import build_star_schema, distinct_count, fare_mean, passenger_sum, route_distances
+
+
+@pytest.fixture(scope='module')
+def star(dataset):
+    return build_star_schema(rollup_dataset(dataset.path))
+
+
+# Helper function to compare an aggregate of the star schema with the one of pandas, sorted by its keys
+def assert_aggregate_equal(result, expected, keys):
+    result = result.astype({key: str for key in keys}).sort_values(keys, ignore_index=True)
+    expected = expected.reset_index().astype({key: str for key in keys}).sort_values(keys, ignore_index=True)
+    pd.testing.assert_frame_equal(result, expected[result.columns], check_dtype=False)
+
+
+@pytest.mark.parametrize('keys', [['Year'], ['Year', 'Quarter'], ['OriginCity'], ['DestinationAirportCode'], ['Route']])
+def test_passenger_sum(star, dataset, keys):
+    expected = dataset.frame.groupby(keys)['PassengerCount'].sum()
+    assert_aggregate_equal(passenger_sum(star, keys), expected, keys)
+
+
+@pytest.mark.parametrize('keys', [['Year'], ['Year', 'Quarter'], ['LowestFareCarrierCode'], ['Route']])
+def test_fare_mean(star, dataset, keys):
+    expected = dataset.frame.groupby(keys)['AverageFare'].mean()
+    assert_aggregate_equal(fare_mean(star, keys), expected, keys)
+
+
+@pytest.mark.parametrize('columns', [['OriginCity', 'DestinationCity'], ['LargestCarrierCode'], ['Route']])
+def test_distinct_count(star, dataset, columns):
+    expected = pd.unique(np.concatenate([dataset.frame[column].to_numpy() for column in columns]))
+    assert distinct_count(star, *columns) == len(expected)
+
+
+def test_route_distances(star, dataset):
+    # Every route has its largest distance, whatever the order of its rows
+    expected = (
+        dataset.frame.groupby('Route')['RouteDistanceInMiles'].max().reset_index()
+        .sort_values(['RouteDistanceInMiles', 'Route'], ignore_index=True)
+    )
+    pd.testing.assert_frame_equal(route_distances(star).reset_index(drop=True), expected, check_dtype=False)
@@ -0,0 +1,89 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from figure_cache import CACHE_DIR
+
+try:
+    import fcntl
+except ImportError:
+    # Windows runs the development server only, a single process with no other worker to wait for
+    fcntl = None
+
+# Precompute the popular selections after start-up, "0" reports the app ready right away
+WARMUP = os.environ.get("WARMUP", "1") != "0"
+
+# Threads computing the selections, each one computes a figure at a time
+WARMUP_THREADS = int(os.environ.get("WARMUP_THREADS", 2))
+
+# Lock file taken by the worker warming up, so that the others wait and then find the figures cached
+LOCK_PATH = os.path.join(CACHE_DIR, "warmup.lock")
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """Figures computed on a thread pool after a worker starts, before it reports itself ready.
+
+    The tasks are functions filling the figure caches, e.g. a memoized callback with its
+    arguments. One worker at a time runs them, so the workers started with it only find the
+    figures cached instead of computing them again.
+    """
+
+    def __init__(self, tasks, threads=WARMUP_THREADS, enabled=WARMUP, lock_path=LOCK_PATH):
+        # tasks returns the {name: function} to run, called when the warmup starts
+        self.tasks = tasks
+        self.threads = threads
+        self.enabled = enabled
+        self.lock_path = lock_path
+        self._lock = threading.Lock()
+        self._thread = None
+        self._status = {"ready": not enabled, "done": 0, "total": 0, "failed": [], "seconds": None}
+
+    def start(self):
+        """Run the tasks in a background thread, once per process."""
+        with self._lock:
+            if not self.enabled or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def status(self):
+        with self._lock:
+            return dict(self._status, failed=list(self._status["failed"]))
+
+    def run(self):
+        start = time.perf_counter()
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                tasks = self.tasks()
+                with self._lock:
+                    self._status["total"] = len(tasks)
+                with ThreadPoolExecutor(self.threads, thread_name_prefix="warmup") as pool:
+                    for name, function in tasks.items():
+                        pool.submit(self._run_task, name, function)
+            except Exception:
+                # A failed warmup only costs latency, the worker still serves requests
+                logger.exception("Warmup failed")
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        with self._lock:
+            self._status.update(ready=True, seconds=round(time.perf_counter() - start, 3))
+
+    def _run_task(self, name, function):
+        try:
+            with metrics.recording("warmup"):
+                function()
+        except Exception:
+            logger.exception("Warmup of %s failed", name)
+            with self._lock:
+                self._status["failed"].append(name)
+        finally:
+            with self._lock:
+                self._status["done"] += 1